@@ -12,11 +12,22 @@ import httpx
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+try:  # optional: kompaktes Binärformat für Antworten des RAG-Service
+    import msgpack
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    msgpack = None
+
 RAG_DATA_GLOB = os.environ.get('RAG_DATA_GLOB', '/data/*.jsonl')
 RAG_TOP_K = int(os.environ.get('RAG_TOP_K', '4'))
 RAG_MAX_DOCS = int(os.environ.get('RAG_MAX_DOCS', '2000'))
 RAG_SERVICE_URL = os.environ.get('RAG_SERVICE_URL', '').strip()
 RAG_SERVICE_TIMEOUT = float(os.environ.get('RAG_SERVICE_TIMEOUT', '5.0'))
+# Kompakte Formate lassen `block` weg; der Client baut ihn aus den Feldern selbst zusammen.
+RAG_SERVICE_ACCEPT = (
+    'application/msgpack, application/vnd.rag.compact+json;q=0.9, application/json;q=0.5'
+    if msgpack is not None
+    else 'application/vnd.rag.compact+json, application/json;q=0.5'
+)
 GERMAN_STOPWORDS = [
     'der', 'die', 'das', 'und', 'oder', 'ein', 'eine', 'ist', 'sind', 'den', 'dem',
     'mit', 'für', 'auf', 'im', 'in', 'zu', 'vom', 'am', 'aus', 'dass', 'nicht',
@@ -184,6 +195,13 @@ class _RemoteRAGClient:
             return ''
         return '\n\n'.join(blocks)
 
+    @staticmethod
+    def _decode(response: httpx.Response) -> object:
+        content_type = response.headers.get('content-type', '').split(';', 1)[0].strip()
+        if content_type == 'application/msgpack' and msgpack is not None:
+            return msgpack.unpackb(response.content, raw=False)
+        return response.json()
+
     def _fetch_blocks(self, persona: str, prompt: str, limit: int | None) -> list[str]:
         payload = {
             'query': prompt,
@@ -193,16 +211,18 @@ class _RemoteRAGClient:
             payload['persona'] = persona
         try:
             with httpx.Client(timeout=self._timeout) as client:
-                response = client.post(self._endpoint, json=payload)
+                response = client.post(self._endpoint, json=payload, headers={'Accept': RAG_SERVICE_ACCEPT})
                 response.raise_for_status()
-                data = response.json()
+                data = self._decode(response)
             self._warned = False
-        except httpx.HTTPError as exc:
+        except (httpx.HTTPError, ValueError) as exc:
             if not self._warned:
                 logger.warning('Remote RAG-Service nicht erreichbar (%s) – nutze lokalen Fallback.', exc)
                 self._warned = True
             return []
 
+        if not isinstance(data, dict):
+            return []
         chunks = data.get('chunks')
         if not isinstance(chunks, list):
             return []
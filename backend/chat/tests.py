@@ -45,3 +45,35 @@ class ChatViewTests(TestCase):
             content_type='application/json',
         )
         self.assertEqual(response.status_code, 404)
+
+
+class RemoteRAGClientTests(TestCase):
+    @patch('chat.rag.httpx.Client')
+    def test_compact_response_without_block(self, client_mock: MagicMock) -> None:
+        from chat.rag import RAG_SERVICE_ACCEPT, _RemoteRAGClient
+
+        mock_client = MagicMock()
+        client_mock.return_value.__enter__.return_value = mock_client
+        response_mock = MagicMock()
+        response_mock.headers = {'content-type': 'application/vnd.rag.compact+json'}
+        response_mock.json.return_value = {
+            'chunks': [
+                {
+                    'persona': 'kant',
+                    'source': 'kant.jsonl',
+                    'question': 'Was ist Aufklärung?',
+                    'answer': 'Der Ausgang aus der Unmündigkeit.',
+                    'score': 0.9,
+                },
+            ],
+        }
+        response_mock.raise_for_status.return_value = None
+        mock_client.post.return_value = response_mock
+
+        context = _RemoteRAGClient('127.0.0.1:9400', 1.0).build_context('kant', 'Aufklärung', 1)
+
+        self.assertEqual(
+            context,
+            'Quelle: kant.jsonl (Persona: kant)\nFrage: Was ist Aufklärung?\nAntwort: Der Ausgang aus der Unmündigkeit.',
+        )
+        self.assertEqual(mock_client.post.call_args.kwargs['headers'], {'Accept': RAG_SERVICE_ACCEPT})
@@ -1,6 +1,20 @@
 """Lightweight RAG microservice for the Ethik stack."""
 
-from .documents import Document, load_documents
-from .index import VectorIndex
+from __future__ import annotations
+
+import importlib
 
 __all__ = ['Document', 'load_documents', 'VectorIndex']
+
+# Lazy re-exports: spawn-Worker des Loaders importieren nur rag_service.documents und sollen
+# dabei nicht über .index den Encoder (sentence_transformers/torch) mitladen.
+_EXPORTS = {'Document': '.documents', 'load_documents': '.documents', 'VectorIndex': '.index'}
+
+
+def __getattr__(name: str) -> object:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
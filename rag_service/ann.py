@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('exact', 'ivf')
+_ASSIGN_BLOCK_ROWS = 16384
+_TRAIN_POINTS_PER_LIST = 64
+_RECALL_K = 10
+_RECALL_QUERIES = 200
+
+
+def default_nlist(size: int) -> int:
+    return max(1, min(size, int(4 * math.sqrt(size))))
+
+
+def _as_float32(block: np.ndarray) -> np.ndarray:
+    return block if block.dtype == np.float32 else block.astype(np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(embeddings.shape[0], dtype=np.int32)
+    for start in range(0, embeddings.shape[0], _ASSIGN_BLOCK_ROWS):
+        block = _as_float32(embeddings[start:start + _ASSIGN_BLOCK_ROWS])
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _spherical_kmeans(sample: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        nonempty = np.flatnonzero(counts)
+        order = np.argsort(assignments, kind='stable')
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = sample[rng.choice(sample.shape[0], empty.size, replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+# Inverted-File-Index: k-means-Zentroide plus Dokument-Ids, gruppiert nach nächstem Zentroid.
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray) -> None:
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.order = order.astype(np.int64, copy=False)
+        self.offsets = offsets.astype(np.int64, copy=False)
+        # Gemessener recall@k pro nprobe; Zentroide und Listen hängen nicht von nprobe ab.
+        self.recalls: dict[int, float] = {}
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def train(cls, embeddings: np.ndarray, nlist: int, iterations: int = 15, seed: int = 0) -> IVFIndex:
+        size = embeddings.shape[0]
+        nlist = max(1, min(nlist or default_nlist(size), size))
+        rng = np.random.default_rng(seed)
+        sample_size = min(size, nlist * _TRAIN_POINTS_PER_LIST)
+        sample_ids = np.sort(rng.choice(size, sample_size, replace=False))
+        sample = _as_float32(embeddings[sample_ids])
+        centroids = _spherical_kmeans(sample, nlist, iterations, rng)
+        assignments = _assign(embeddings, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+        return cls(centroids, order, offsets)
+
+    def probe(self, query_vec: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query_vec
+        if nprobe < self.nlist:
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(self.nlist)
+        ids = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+        # Sortierte Ids lesen gemappte Embeddings sequentiell statt kreuz und quer.
+        ids.sort()
+        return ids
+
+    def save(self, path: Path, key: str) -> None:
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez(
+            tmp_path,
+            key=np.array(key),
+            centroids=self.centroids,
+            order=self.order,
+            offsets=self.offsets,
+            recall_nprobe=np.array(sorted(self.recalls), dtype=np.int64),
+            recall=np.array([self.recalls[nprobe] for nprobe in sorted(self.recalls)], dtype=np.float64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, key: str, size: int) -> IVFIndex | None:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['key']) != key:
+                    return None
+                index = cls(data['centroids'], data['order'], data['offsets'])
+                # Ältere Dateien haben einen einzelnen recall ohne nprobe; der wird neu gemessen.
+                if 'recall_nprobe' in data.files:
+                    index.recalls = dict(zip(data['recall_nprobe'].tolist(), data['recall'].tolist()))
+        except (OSError, ValueError, KeyError):
+            return None
+        if index.order.shape[0] != size or index.offsets.shape[0] != index.nlist + 1:
+            return None
+        return index
+
+
+def measure_recall(
+    embeddings: np.ndarray,
+    exact: Callable[[np.ndarray, int], np.ndarray],
+    approximate: Callable[[np.ndarray, int], np.ndarray],
+    k: int = _RECALL_K,
+    queries: int = _RECALL_QUERIES,
+    seed: int = 0,
+) -> float:
+    # Anfragen sind leicht verrauschte Dokumentvektoren, damit nicht nur das Dokument selbst getroffen wird.
+    size = embeddings.shape[0]
+    if size == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    sample_ids = rng.choice(size, min(size, queries), replace=False)
+    sample = _as_float32(embeddings[np.sort(sample_ids)])
+    noise = rng.standard_normal(sample.shape).astype(np.float32) / math.sqrt(sample.shape[1])
+    sample = _normalize(sample + 0.5 * noise)
+    k = min(k, size)
+    hits = 0
+    for query_vec in sample:
+        expected = set(exact(query_vec, k).tolist())
+        hits += len(expected.intersection(approximate(query_vec, k).tolist()))
+    return hits / (k * sample.shape[0])
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EncoderBatcher:
+    # Sammelt gleichzeitige Einzelanfragen für ein Zeitfenster (oder bis max_batch) und
+    # embeddet sie mit einem einzigen encode()-Aufruf; jeder Aufrufer wartet auf sein Future.
+    def __init__(
+        self,
+        encode: Callable[[Sequence[str]], np.ndarray],
+        window_ms: float,
+        max_batch: int,
+    ) -> None:
+        self._encode = encode
+        self._window = max(0.0, window_ms) / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._queue: queue.Queue[tuple[str, Future, float] | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._wait_seconds = 0.0
+        self._encode_seconds = 0.0
+        self._size_histogram = [0] * (len(_BATCH_SIZE_BUCKETS) + 1)
+        self._pid = -1
+
+    def _ensure_thread(self) -> None:
+        # Der Thread startet erst bei der ersten Anfrage und nach einem fork() im Kind neu.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='rag-encoder-batcher', daemon=True).start()
+
+    def encode(self, text: str) -> np.ndarray:
+        future: Future = Future()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._ensure_thread()
+                self._queue.put((text, future, time.perf_counter()))
+                self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        # Nach close() (z. B. alter Index nach einem Reload) direkt encodieren, ohne den Lock zu halten.
+        if closed:
+            return self._encode([text])[0]
+        return future.result()
+
+    def close(self) -> None:
+        # Bereits eingereihte Anfragen werden noch abgearbeitet, danach endet der Thread.
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+
+    def _collect(self) -> tuple[list[tuple[str, Future, float]], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        finished_queue = False
+        while not finished_queue:
+            batch, finished_queue = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                vectors = self._encode([text for text, _, _ in batch])
+            except Exception as exc:  # an alle wartenden Aufrufer weiterreichen
+                logger.exception('Gebündeltes Encoding fehlgeschlagen (%s Anfragen).', len(batch))
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            finished = time.perf_counter()
+            for row, (_, future, _) in enumerate(batch):
+                future.set_result(vectors[row])
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._encode_seconds += finished - started
+                self._wait_seconds += sum(started - enqueued for _, _, enqueued in batch)
+                bucket = next(
+                    (pos for pos, bound in enumerate(_BATCH_SIZE_BUCKETS) if len(batch) <= bound),
+                    len(_BATCH_SIZE_BUCKETS),
+                )
+                self._size_histogram[bucket] += 1
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            batches = self._batches
+            items = self._items
+            histogram = {f'le_{bound}': count for bound, count in zip(_BATCH_SIZE_BUCKETS, self._size_histogram)}
+            histogram[f'gt_{_BATCH_SIZE_BUCKETS[-1]}'] = self._size_histogram[-1]
+            return {
+                'window_ms': self._window * 1000.0,
+                'max_batch': self._max_batch,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batches': batches,
+                'items': items,
+                'mean_batch_size': round(items / batches, 3) if batches else None,
+                'mean_wait_ms': round(self._wait_seconds / items * 1000.0, 3) if items else None,
+                'mean_encode_ms': round(self._encode_seconds / batches * 1000.0, 3) if batches else None,
+                'batch_size_histogram': histogram,
+            }
@@ -0,0 +1,597 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import multiprocessing
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Sequence
+
+import numpy as np
+
+from .config import RAG_CACHE_DIR, RAG_DATA_GLOB, RAG_EMBED_MODEL
+from .documents import Document, compute_corpus_signature, iter_files, load_documents, load_documents_parallel
+from .encoders import ENCODER_BACKENDS, HashEncoder, cosine_agreement, describe_encoder, load_encoder
+from .index import SearchResult, VectorIndex
+from .procinfo import memory_usage
+from .responses import COMPACT_JSON, JSON, MSGPACK, build_response, compact_response, dumps, loads, msgpack
+from .schemas import block_text
+from .scoring import dot_scores, top_positions
+from .snapshot import read_snapshot
+from .sparse import KeywordIndex
+from .store import load_document_store
+
+PERSONAS = ('gehlen', 'kant', 'loewith', 'marx', 'plessner')
+_WORDS = (
+    'Mensch', 'Vernunft', 'Freiheit', 'Arbeit', 'Natur', 'Kultur', 'Gesellschaft', 'Moral', 'Pflicht',
+    'Entfremdung', 'Institution', 'Mängelwesen', 'Exzentrizität', 'Welt', 'Geschichte', 'Würde',
+)
+
+
+def _random_unit_vectors(rows: int, dim: int, seed: int, dtype: str = 'float32') -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dim), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix.astype(dtype, copy=False)
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> dict[str, float]:
+    fn()
+    timings: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings) * 1000, 4),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 4),
+        'peak_alloc_bytes': peak,
+    }
+
+
+def bench_topk(args: argparse.Namespace) -> list[dict[str, object]]:
+    personas = max(1, args.personas)
+    embeddings = _random_unit_vectors(args.docs, args.dim, seed=0, dtype=args.dtype)
+    query_vec = _random_unit_vectors(1, args.dim, seed=1)[0]
+    per_persona = args.docs // personas
+    # Vorher: Persona-Ids verstreut (round robin), Kopie per Fancy-Indexing, Sortierung in Python.
+    scattered = list(range(0, args.docs, personas))
+    # Nachher: Persona als zusammenhängender Block, View plus argpartition.
+    start, stop = 0, per_persona
+
+    def legacy() -> list[tuple[int, float]]:
+        scores = dot_scores(embeddings[scattered], query_vec)
+        ranked = sorted(zip(scattered, scores.tolist()), key=lambda item: item[1], reverse=True)
+        return ranked[: args.top_k]
+
+    def contiguous() -> np.ndarray:
+        scores = dot_scores(embeddings[start:stop], query_vec)
+        return top_positions(scores, args.top_k)
+
+    results = []
+    for name, fn in (('legacy', legacy), ('contiguous', contiguous)):
+        row = {'bench': 'topk', 'variant': name, 'docs': args.docs, 'persona_docs': per_persona, 'dim': args.dim}
+        row.update(_measure(fn, args.repeat))
+        results.append(row)
+    return results
+
+
+def write_synthetic_corpus(
+    directory: Path,
+    lines: int,
+    seed: int = 0,
+    words: Sequence[str] = _WORDS,
+    weights: Sequence[float] | None = None,
+    system_words: int = 0,
+) -> list[Path]:
+    rng = random.Random(seed)
+    per_persona = max(1, lines // len(PERSONAS))
+    paths: list[Path] = []
+    for persona in PERSONAS:
+        path = directory / f'{persona}.jsonl'
+        system = f'Du bist {persona.capitalize()} und antwortest aus deiner philosophischen Perspektive.'
+        if system_words:
+            # Lange, pro Persona identische System-Prompts wie in den echten Trainingsdaten.
+            system += ' ' + ' '.join(random.Random(persona).choices(words, k=system_words))
+        with path.open('w', encoding='utf-8') as handle:
+            for row in range(per_persona):
+                question = ' '.join(rng.choices(words, weights, k=8)) + f' ({row})?'
+                answer = ' '.join(rng.choices(words, weights, k=40)) + '.'
+                payload = {
+                    'messages': [
+                        {'role': 'system', 'content': system},
+                        {'role': 'user', 'content': question},
+                        {'role': 'assistant', 'content': answer},
+                    ],
+                }
+                handle.write(json.dumps(payload, ensure_ascii=False) + '\n')
+        paths.append(path)
+    return paths
+
+
+def bench_loader(args: argparse.Namespace) -> list[dict[str, object]]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix='rag-bench-') as tmp:
+        write_synthetic_corpus(Path(tmp), args.lines)
+        pattern = str(Path(tmp) / '*.jsonl')
+        started = time.perf_counter()
+        reference = load_documents(pattern, 0)
+        # Die Referenzliste aus dem zyklischen GC nehmen, damit sie die folgenden Läufe nicht bremst.
+        gc.freeze()
+        results.append({
+            'bench': 'loader',
+            'variant': 'sequential',
+            'lines': args.lines,
+            'seconds': round(time.perf_counter() - started, 3),
+        })
+        for workers in args.workers:
+            started = time.perf_counter()
+            loaded = load_documents_parallel(pattern, 0, workers=workers, chunk_bytes=args.chunk_bytes)
+            elapsed = time.perf_counter() - started
+            results.append({
+                'bench': 'loader',
+                'variant': 'parallel',
+                'workers': workers,
+                'lines': args.lines,
+                'seconds': round(elapsed, 3),
+                'identical': loaded == reference,
+            })
+            del loaded
+        gc.unfreeze()
+    return results
+
+
+def _synthetic_keyword_corpus(docs: int, dim: int, vocabulary: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    # Zipf-verteilte Kunstwörter; ein Vektor ist die normierte Summe seiner Wortvektoren, damit
+    # Keyword-Überlappung und Dense-Ähnlichkeit wie bei echten Embeddings korrelieren.
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    word_ids = rng.choice(vocabulary, size=(docs, 24), p=weights / weights.sum())
+    return word_ids, _random_unit_vectors(vocabulary, dim, seed)
+
+
+def _embed_words(word_vectors: np.ndarray, word_ids: np.ndarray) -> np.ndarray:
+    embeddings = np.empty((word_ids.shape[0], word_vectors.shape[1]), dtype=np.float32)
+    for start in range(0, word_ids.shape[0], 4096):
+        block = word_vectors[word_ids[start:start + 4096]].sum(axis=1)
+        embeddings[start:start + block.shape[0]] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return embeddings
+
+
+def bench_sparse(args: argparse.Namespace) -> list[dict[str, object]]:
+    results = []
+    rng = np.random.default_rng(0)
+    for docs in args.docs:
+        word_ids, word_vectors = _synthetic_keyword_corpus(docs, args.dim, args.vocabulary, seed=docs)
+        embeddings = _embed_words(word_vectors, word_ids)
+        texts = [[f'begriff{idx}' for idx in row] for row in word_ids]
+        documents = [Document('kant', ' '.join(text[:8]), ' '.join(text[8:]), '', 'bench') for text in texts]
+        del texts
+        keywords = KeywordIndex.build(documents)
+        del documents
+        # Anfragen: vier Wörter eines zufälligen Dokuments, eingebettet wie die Dokumente.
+        rows = rng.integers(0, docs, args.queries)
+        query_ids = np.stack([rng.choice(word_ids[row], 4, replace=False) for row in rows])
+        queries = [' '.join(f'begriff{idx}' for idx in row) for row in query_ids]
+        vectors = _embed_words(word_vectors, query_ids)
+        min_hits = max(args.min_hits, args.top_k)
+
+        def search(position: int, prefilter: bool) -> np.ndarray:
+            vec = vectors[position]
+            ids = keywords.candidates(queries[position], 0, docs, min_hits) if prefilter else None
+            if ids is None:
+                return top_positions(dot_scores(embeddings, vec), args.top_k)
+            return ids[top_positions(dot_scores(embeddings[ids], vec), args.top_k)]
+
+        hits = sum(
+            len(set(search(position, False).tolist()).intersection(search(position, True).tolist()))
+            for position in range(len(queries))
+        )
+        for name, prefilter in (('full', False), ('prefilter', True)):
+            cursor = iter(range(1 << 62))
+            row: dict[str, object] = {'bench': 'sparse', 'variant': name, 'docs': docs, 'dim': args.dim}
+            row.update(_measure(lambda: search(next(cursor) % len(queries), prefilter), args.repeat))
+            if prefilter:
+                stats = keywords.stats()
+                row.update({
+                    'recall_at_k': round(hits / (args.top_k * len(queries)), 4),
+                    'candidate_ratio': stats['candidate_ratio'],
+                    'fallbacks': stats['fallbacks'],
+                    'lookups': stats['lookups'],
+                    'index_bytes': stats['bytes'],
+                })
+            results.append(row)
+    return results
+
+
+def bench_encoder(args: argparse.Namespace) -> list[dict[str, object]]:
+    documents, _ = load_documents_parallel(args.data, args.sample)
+    texts = [doc.question for doc in documents] or ['Was ist der Mensch?']
+    results = []
+    reference: np.ndarray | None = None
+    for backend in args.backends:
+        encoder = load_encoder(
+            backend,
+            args.model,
+            Path(args.cache_dir),
+            sample=[doc.context for doc in documents],
+            threads=args.threads,
+        )
+        active = describe_encoder(encoder)['backend']
+        cursor = iter(range(1 << 62))
+        row: dict[str, object] = {'bench': 'encoder', 'variant': backend, 'active': active, 'queries': len(texts)}
+        # Eine Anfrage pro Aufruf, wie im Dienst ohne Coalescing.
+        row.update(_measure(
+            lambda: encoder.encode([texts[next(cursor) % len(texts)]], batch_size=1, normalize_embeddings=True),
+            args.repeat,
+        ))
+        vectors = encoder.encode(texts, batch_size=32, normalize_embeddings=True)
+        if reference is None:
+            reference = vectors
+        # Nur vergleichbar bei gleicher Dimension (z. B. nicht nach einem Fallback auf ein anderes Modell).
+        if reference.shape == vectors.shape:
+            row['agreement_vs_first'] = cosine_agreement(reference, vectors)
+        else:
+            row['agreement_vs_first'] = None
+        results.append(row)
+    return results
+
+
+def bench_serialization(args: argparse.Namespace) -> list[dict[str, object]]:
+    # Antwort-Serialisierung im Server plus Dekodieren und Zusammensetzen der Blöcke im Client.
+    rng = random.Random(0)
+    results = [
+        SearchResult(
+            Document(
+                persona=rng.choice(PERSONAS),
+                question=' '.join(rng.choices(_WORDS, k=args.question_words)) + '?',
+                answer=' '.join(rng.choices(_WORDS, k=args.answer_words)) + '.',
+                system='',
+                source='synthetic.jsonl',
+            ),
+            rng.random(),
+        )
+        for _ in range(args.top_k)
+    ]
+
+    def blocks(data: dict) -> list[str]:
+        return [
+            chunk.get('block') or block_text(chunk['source'], chunk['persona'], chunk['question'], chunk['answer'])
+            for chunk in data['chunks']
+        ]
+
+    formats = [JSON, COMPACT_JSON] + ([MSGPACK] if msgpack is not None else [])
+    rows = []
+    for media_type in formats:
+        if media_type == JSON:
+            def encode() -> bytes:
+                return build_response('frage', 'kant', args.top_k, results, 100_000).model_dump_json().encode('utf-8')
+        else:
+            def encode() -> bytes:
+                return dumps(compact_response('frage', 'kant', args.top_k, results, 100_000), media_type)
+        body = encode()
+        server = _measure(encode, args.repeat)
+        client = _measure(lambda: blocks(loads(body, media_type)), args.repeat)
+        rows.append({
+            'bench': 'serialization',
+            'format': media_type,
+            'top_k': args.top_k,
+            'bytes': len(body),
+            'server_p50_ms': server['p50_ms'],
+            'server_p99_ms': server['p99_ms'],
+            'server_peak_alloc_bytes': server['peak_alloc_bytes'],
+            'client_p50_ms': client['p50_ms'],
+            'client_p99_ms': client['p99_ms'],
+        })
+    return rows
+
+
+# Varianten der Suite: Name -> VectorIndex-Parameter. exact ist die Referenz für recall@k.
+SUITE_VARIANTS: dict[str, dict[str, object]] = {
+    'exact': {},
+    'float16': {'storage_dtype': 'float16'},
+    'int8': {'storage': 'int8'},
+    'ivf': {'index_type': 'ivf'},
+    'pca': {'reduction': 'pca', 'reduced_dim': 128},
+    'sparse': {'sparse_prefilter': True},
+}
+
+
+def _percentiles(timings: list[float], prefix: str) -> dict[str, float | None]:
+    timings = sorted(timings)
+
+    def pick(fraction: float) -> float | None:
+        if not timings:
+            return None
+        return round(timings[min(len(timings) - 1, int(len(timings) * fraction))] * 1000, 4)
+
+    return {f'{prefix}_p50_ms': pick(0.5), f'{prefix}_p95_ms': pick(0.95), f'{prefix}_p99_ms': pick(0.99)}
+
+
+def _suite_phase(spec: dict[str, object]) -> dict[str, object]:
+    # Läuft in einem frisch gestarteten Prozess, damit Peak-RSS und Warmstart pro Phase sauber sind.
+    pattern = str(spec['data'])
+    cache_dir = Path(str(spec['cache_dir']))
+    key = {
+        'corpus': compute_corpus_signature(list(iter_files(pattern)), 'max_docs=0'),
+        'variant': spec['variant'],
+        'dim': spec['dim'],
+    }
+    started = time.perf_counter()
+    snapshot = read_snapshot(cache_dir / 'snapshot.bin', key) if spec['phase'] == 'warm' else None
+    if snapshot is not None:
+        documents, signature = snapshot.documents, snapshot.signature
+    else:
+        documents, files = load_document_store(pattern, 0, workers=1)
+        signature = compute_corpus_signature(files, str(len(documents)))
+    index = VectorIndex(
+        documents,
+        cache_dir=cache_dir,
+        signature=signature,
+        model_name=f'hash-{spec["dim"]}',
+        batch_size=64,
+        force_rebuild=spec['phase'] == 'cold',
+        mmap=True,
+        encoder=HashEncoder(int(spec['dim'])),
+        snapshot=snapshot,
+        **SUITE_VARIANTS[str(spec['variant'])],
+    )
+    seconds = time.perf_counter() - started
+    if spec['phase'] == 'cold':
+        index.save_snapshot(cache_dir / 'snapshot.bin', key)
+    row: dict[str, object] = {'seconds': round(seconds, 3), 'source': index.stats()['source']}
+    if spec['phase'] == 'warm':
+        queries = [tuple(item) for item in spec['queries']]
+        top_k = int(spec['top_k'])
+        timings: list[float] = []
+        found: list[list[str]] = []
+        for persona, query in queries:
+            begin = time.perf_counter()
+            results = index.query(persona, query, top_k)
+            timings.append(time.perf_counter() - begin)
+            found.append([f'{result.document.persona}/{result.document.question}' for result in results])
+        row.update(_percentiles(timings, 'single'))
+        batch = int(spec['batch'])
+        timings = []
+        for start in range(0, len(queries), batch):
+            items = [(persona, query, top_k) for persona, query in queries[start:start + batch]]
+            begin = time.perf_counter()
+            index.query_batch(items)
+            timings.append(time.perf_counter() - begin)
+        row.update(_percentiles(timings, 'batch'))
+        row['results'] = found
+        stats = index.stats()
+        row['index'] = {name: stats[name] for name in ('dimension', 'embeddings_bytes', 'ivf', 'int8', 'reduction')}
+    index.close()
+    row['peak_rss_bytes'] = memory_usage()['peak_rss_bytes']
+    return row
+
+
+def _run_isolated(spec: dict[str, object], fn: Callable[[dict[str, object]], dict[str, object]] = _suite_phase):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(fn, spec).result()
+
+
+def _store_phase(spec: dict[str, object]) -> dict[str, object]:
+    # Eigener Prozess je Layout: RSS-Zuwachs durch das Laden, ohne Reste der anderen Variante.
+    gc.collect()
+    before = memory_usage()['rss_bytes'] or 0
+    started = time.perf_counter()
+    contexts: list[str] = []
+    if spec['layout'] != 'columnar':
+        documents = load_documents_parallel(str(spec['data']), 0, workers=1)[0]
+        if spec['layout'] == 'list+context':
+            # Früheres Layout: der Kontext wurde pro Dokument als eigener String gehalten.
+            contexts = [doc.context for doc in documents]
+    else:
+        documents = load_document_store(str(spec['data']), 0, workers=1)[0]
+    seconds = time.perf_counter() - started
+    gc.collect()
+    after = memory_usage()['rss_bytes'] or 0
+    rng = random.Random(0)
+    rows = [rng.randrange(len(documents)) for _ in range(int(spec['lookups']))]
+    started = time.perf_counter()
+    for idx in rows:
+        documents[idx].context
+    lookup = time.perf_counter() - started
+    return {
+        'docs': len(documents),
+        'load_seconds': round(seconds, 3),
+        'rss_delta_bytes': after - before,
+        'lookup_us': round(lookup / max(1, len(rows)) * 1e6, 3),
+        'materialized_contexts': len(contexts),
+    }
+
+
+def _suite_queries(documents: list[Document], count: int, seed: int) -> list[tuple[str, str]]:
+    # Anfragen: fünf Wörter aus der Frage eines zufälligen Dokuments, gemischt, mit dessen Persona.
+    rng = random.Random(seed)
+    queries = []
+    for doc in rng.sample(documents, min(count, len(documents))):
+        words = doc.question.split()[:8]
+        queries.append((doc.persona, ' '.join(rng.sample(words, min(5, len(words))))))
+    return queries
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_store(args: argparse.Namespace) -> list[dict[str, object]]:
+    # Dokumentablage: Liste von Document-Dataclasses vs. spaltenorientierter DocumentStore.
+    results = []
+    with tempfile.TemporaryDirectory(prefix='rag-store-') as tmp:
+        for docs in args.sizes:
+            corpus = Path(tmp) / f'corpus-{docs}'
+            corpus.mkdir()
+            write_synthetic_corpus(corpus, docs, seed=docs, system_words=args.system_words)
+            spec = {'data': str(corpus / '*.jsonl'), 'lookups': args.lookups}
+            layouts = ('list+context', 'list', 'columnar')
+            rows = {layout: _run_isolated({**spec, 'layout': layout}, _store_phase) for layout in layouts}
+            columnar = max(1, rows['columnar']['rss_delta_bytes'])
+            for layout, row in rows.items():
+                results.append({
+                    'bench': 'store',
+                    'layout': layout,
+                    'system_words': args.system_words,
+                    **row,
+                    'rss_vs_columnar': round(row['rss_delta_bytes'] / columnar, 2),
+                })
+    return results
+
+
+def bench_suite(args: argparse.Namespace) -> list[dict[str, object]]:
+    words = [f'begriff{idx}' for idx in range(args.vocabulary)]
+    weights = [1.0 / rank for rank in range(1, args.vocabulary + 1)]
+    rows: list[dict[str, object]] = []
+    with tempfile.TemporaryDirectory(prefix='rag-suite-') as tmp:
+        for docs in args.sizes:
+            corpus = Path(tmp) / f'corpus-{docs}'
+            corpus.mkdir()
+            write_synthetic_corpus(corpus, docs, seed=docs, words=words, weights=weights)
+            pattern = str(corpus / '*.jsonl')
+            queries = _suite_queries(load_documents(pattern, 0)[0], args.queries, seed=docs)
+            reference: list[list[str]] | None = None
+            for variant in ['exact'] + [name for name in args.variants if name != 'exact']:
+                spec = {
+                    'data': pattern,
+                    'cache_dir': str(Path(tmp) / f'cache-{docs}-{variant}'),
+                    'variant': variant,
+                    'dim': args.dim,
+                    'queries': queries,
+                    'top_k': args.top_k,
+                    'batch': args.batch,
+                }
+                cold = _run_isolated({**spec, 'phase': 'cold'})
+                warm = _run_isolated({**spec, 'phase': 'warm'})
+                found = warm.pop('results')
+                if reference is None:
+                    reference = found
+                hits = sum(len(set(expected) & set(got)) for expected, got in zip(reference, found))
+                total = sum(len(expected) for expected in reference)
+                row: dict[str, object] = {
+                    'bench': 'suite',
+                    'docs': docs,
+                    'variant': variant,
+                    'cold_build_seconds': cold['seconds'],
+                    'cold_peak_rss_bytes': cold['peak_rss_bytes'],
+                    'warm_load_seconds': warm.pop('seconds'),
+                    'warm_source': warm.pop('source'),
+                    'warm_peak_rss_bytes': warm.pop('peak_rss_bytes'),
+                    'recall_at_k': round(hits / total, 4) if total else None,
+                }
+                row.update(warm)
+                rows.append(row)
+                print(json.dumps(row), flush=True)
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': multiprocessing.cpu_count(),
+            'encoder': f'hash-{args.dim}',
+            'args': {name: value for name, value in vars(args).items() if name != 'func'},
+        },
+        'results': rows,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+    return []
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Micro-Benchmarks für rag_service')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    topk = sub.add_parser('topk', help='Persona-Query: Kopie + Sortierung vs. View + argpartition')
+    topk.add_argument('--docs', type=int, default=200_000)
+    topk.add_argument('--dim', type=int, default=768)
+    topk.add_argument('--personas', type=int, default=5)
+    topk.add_argument('--top-k', type=int, default=4)
+    topk.add_argument('--dtype', choices=('float32', 'float16'), default='float32')
+    topk.add_argument('--repeat', type=int, default=50)
+    topk.set_defaults(func=bench_topk)
+
+    loader = sub.add_parser('loader', help='JSONL-Loader: sequentiell vs. parallel auf synthetischem Korpus')
+    loader.add_argument('--lines', type=int, default=1_000_000)
+    loader.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    loader.add_argument('--chunk-bytes', type=int, default=4 << 20)
+    loader.set_defaults(func=bench_loader)
+
+    sparse = sub.add_parser('sparse', help='Keyword-Vorfilter + Dense-Scoring vs. voller Scan über Korpusgrößen')
+    sparse.add_argument('--docs', type=int, nargs='+', default=[10_000, 50_000, 200_000])
+    sparse.add_argument('--dim', type=int, default=384)
+    sparse.add_argument('--vocabulary', type=int, default=20_000)
+    sparse.add_argument('--queries', type=int, default=100)
+    sparse.add_argument('--top-k', type=int, default=4)
+    sparse.add_argument('--min-hits', type=int, default=32)
+    sparse.add_argument('--repeat', type=int, default=100)
+    sparse.set_defaults(func=bench_sparse)
+
+    encoder = sub.add_parser('encoder', help='Einzelanfrage-Latenz je Encoder-Backend (PyTorch vs. ONNX Runtime)')
+    encoder.add_argument('--data', default=RAG_DATA_GLOB)
+    encoder.add_argument('--model', default=RAG_EMBED_MODEL)
+    encoder.add_argument('--cache-dir', default=str(RAG_CACHE_DIR))
+    encoder.add_argument('--backends', nargs='+', choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    encoder.add_argument('--sample', type=int, default=256)
+    encoder.add_argument('--threads', type=int, default=0)
+    encoder.add_argument('--repeat', type=int, default=200)
+    encoder.set_defaults(func=bench_encoder)
+
+    serialization = sub.add_parser('serialization', help='Antwortformate: JSON vs. kompaktes JSON vs. msgpack')
+    serialization.add_argument('--top-k', type=int, default=20)
+    serialization.add_argument('--question-words', type=int, default=12)
+    serialization.add_argument('--answer-words', type=int, default=90)
+    serialization.add_argument('--repeat', type=int, default=2000)
+    serialization.set_defaults(func=bench_serialization)
+
+    store = sub.add_parser('store', help='RSS, Ladezeit und Zugriff: Document-Liste vs. spaltenorientierter Speicher')
+    store.add_argument('--sizes', type=int, nargs='+', default=[100_000, 300_000])
+    store.add_argument('--system-words', type=int, default=60)
+    store.add_argument('--lookups', type=int, default=10_000)
+    store.set_defaults(func=bench_store)
+
+    suite = sub.add_parser(
+        'suite',
+        help='Build, Warmstart, Latenz, RSS und recall@k je Index-Variante und Korpusgröße',
+    )
+    suite.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    suite.add_argument('--variants', nargs='+', choices=tuple(SUITE_VARIANTS), default=list(SUITE_VARIANTS))
+    suite.add_argument('--dim', type=int, default=384)
+    suite.add_argument('--vocabulary', type=int, default=5_000)
+    suite.add_argument('--queries', type=int, default=256)
+    suite.add_argument('--top-k', type=int, default=4)
+    suite.add_argument('--batch', type=int, default=32)
+    suite.add_argument('--output', default='rag-bench.json')
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args(argv)
+    for row in args.func(args):
+        print(json.dumps(row))
+
+
+if __name__ == '__main__':
+    main()
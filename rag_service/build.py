@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from .cache import LRUCache
+from .config import (
+    RAG_BATCH_SIZE,
+    RAG_BUILD_CHECKPOINTS,
+    RAG_BUILD_THREADS,
+    RAG_BUILD_WORKERS,
+    RAG_CACHE_TTL_SECONDS,
+    RAG_COALESCE_MAX_BATCH,
+    RAG_COALESCE_WINDOW_MS,
+    RAG_DATA_GLOB,
+    RAG_EMBED_DTYPE,
+    RAG_EMBED_MMAP,
+    RAG_EMBED_MODEL,
+    RAG_EMBED_REDUCED_DIM,
+    RAG_EMBED_REDUCTION,
+    RAG_EMBED_STORAGE,
+    RAG_ENCODER_BACKEND,
+    RAG_ENCODER_MIN_COSINE,
+    RAG_ENCODER_VERIFY_SAMPLE,
+    RAG_EXACT_QUESTIONS,
+    RAG_INDEX_TYPE,
+    RAG_IVF_NLIST,
+    RAG_IVF_NPROBE,
+    RAG_LOADER_CHUNK_BYTES,
+    RAG_LOADER_WORKERS,
+    RAG_MAX_DOCS,
+    RAG_ONNX_THREADS,
+    RAG_QUERY_CACHE_SIZE,
+    RAG_RESCORE_FACTOR,
+    RAG_RESULT_CACHE_SIZE,
+    RAG_SHARD_COUNT,
+    RAG_SHARD_INDEX,
+    RAG_SHARD_MODE,
+    RAG_SNAPSHOT_DIR,
+    RAG_SPARSE_MIN_HITS,
+    RAG_SPARSE_PREFILTER,
+)
+from .documents import compute_corpus_signature, iter_files
+from .encoders import encoder_id
+from .generations import build_lock
+from .index import LAYOUT, VectorIndex
+from .progress import BuildProgress
+from .sharding import ShardSpec
+from .snapshot import SnapshotError, read_snapshot, snapshot_matches, verify_snapshot
+from .store import load_document_store
+
+logger = logging.getLogger(__name__)
+
+SHARD = ShardSpec(RAG_SHARD_INDEX, RAG_SHARD_COUNT, RAG_SHARD_MODE)
+SNAPSHOT_FILE = 'snapshot.bin'
+# Dateien, die nur der Build braucht; ein gebackenes Snapshot-Verzeichnis kommt ohne sie aus.
+_BUILD_ONLY = ('current', 'generations', 'build', 'build.lock')
+
+
+def index_dir(base: Path) -> Path:
+    # Jeder Shard bekommt ein eigenes Verzeichnis, damit mehrere lokale Prozesse sich nichts überschreiben.
+    return base / SHARD.name if SHARD.enabled else base
+
+
+def corpus_state() -> str:
+    return compute_corpus_signature(list(iter_files(RAG_DATA_GLOB)))
+
+
+def snapshot_key() -> dict[str, object]:
+    # Ohne Parsen berechenbar: Dateistatistiken aller Dateien plus alles, was Auswahl und Embeddings bestimmt.
+    key: dict[str, object] = {
+        'corpus': compute_corpus_signature(list(iter_files(RAG_DATA_GLOB)), f'max_docs={RAG_MAX_DOCS}'),
+        'model': encoder_id(RAG_EMBED_MODEL, RAG_ENCODER_BACKEND),
+        'dtype': RAG_EMBED_DTYPE,
+        'layout': LAYOUT,
+    }
+    if SHARD.enabled:
+        key['shard'] = SHARD.name
+    return key
+
+
+def build_index(
+    cache_dir: Path,
+    previous: VectorIndex | None = None,
+    progress: BuildProgress | None = None,
+    force_rebuild: bool = False,
+    use_snapshot: bool = True,
+    read_only: bool = False,
+    lazy_encoder: bool = False,
+) -> VectorIndex:
+    # read_only: gebackenes Snapshot-Verzeichnis; passt der Snapshot nicht zum Korpus, wird nicht gebaut.
+    key = snapshot_key()
+    snapshot_path = cache_dir / SNAPSHOT_FILE
+    snapshot = read_snapshot(snapshot_path, key) if (use_snapshot or read_only) and not force_rebuild else None
+    if snapshot is None and read_only:
+        raise RuntimeError(
+            f'Kein zum Korpus passender Snapshot unter {snapshot_path} – mit python -m rag_service.build neu bauen'
+        )
+    if snapshot is not None:
+        documents, signature = snapshot.documents, snapshot.signature
+    else:
+        documents, files = load_document_store(
+            RAG_DATA_GLOB,
+            RAG_MAX_DOCS,
+            workers=RAG_LOADER_WORKERS,
+            chunk_bytes=RAG_LOADER_CHUNK_BYTES,
+        )
+        if not documents:
+            logger.warning('Keine RAG-Daten gefunden unter %s – Service liefert leere Antworten.', RAG_DATA_GLOB)
+        # RAG_MAX_DOCS gilt für den Gesamtkorpus, damit alle Shards dieselbe Auswahl partitionieren.
+        documents = SHARD.select(documents)
+        extra = f'{len(documents)}|{SHARD.name}' if SHARD.enabled else str(len(documents))
+        signature = compute_corpus_signature(files, extra)
+    if progress is not None:
+        progress.documents(len(documents))
+    index = VectorIndex(
+        documents,
+        cache_dir=cache_dir,
+        signature=signature,
+        model_name=RAG_EMBED_MODEL,
+        batch_size=RAG_BATCH_SIZE,
+        force_rebuild=force_rebuild,
+        mmap=RAG_EMBED_MMAP,
+        storage_dtype=RAG_EMBED_DTYPE,
+        index_type=RAG_INDEX_TYPE,
+        ivf_nlist=RAG_IVF_NLIST,
+        ivf_nprobe=RAG_IVF_NPROBE,
+        coalesce_window_ms=RAG_COALESCE_WINDOW_MS,
+        coalesce_max_batch=RAG_COALESCE_MAX_BATCH,
+        # Encoder und Caches überleben einen Reload; die Cache-Schlüssel enthalten die Signatur.
+        query_cache=previous.query_cache if previous else LRUCache(RAG_QUERY_CACHE_SIZE, RAG_CACHE_TTL_SECONDS),
+        result_cache=previous.result_cache if previous else LRUCache(RAG_RESULT_CACHE_SIZE, RAG_CACHE_TTL_SECONDS),
+        encoder=previous.encoder if previous else None,
+        storage=RAG_EMBED_STORAGE,
+        rescore_factor=RAG_RESCORE_FACTOR,
+        sparse_prefilter=RAG_SPARSE_PREFILTER,
+        sparse_min_hits=RAG_SPARSE_MIN_HITS,
+        snapshot=snapshot,
+        progress=progress,
+        encoder_backend=RAG_ENCODER_BACKEND,
+        encoder_verify_sample=RAG_ENCODER_VERIFY_SAMPLE,
+        encoder_min_cosine=RAG_ENCODER_MIN_COSINE,
+        encoder_threads=RAG_ONNX_THREADS,
+        reduction=RAG_EMBED_REDUCTION,
+        reduced_dim=RAG_EMBED_REDUCED_DIM,
+        exact_questions=RAG_EXACT_QUESTIONS,
+        build_workers=RAG_BUILD_WORKERS,
+        build_threads=RAG_BUILD_THREADS,
+        build_checkpoints=RAG_BUILD_CHECKPOINTS,
+        read_only=read_only,
+        lazy_encoder=lazy_encoder,
+    )
+    # Auch wenn VectorIndex den Snapshot verworfen hat (anderer Encoder aktiv), wird er ersetzt.
+    if use_snapshot and index.source != 'snapshot':
+        # Unter dem Build-Lock und nur, wenn kein anderer Worker denselben Snapshot schon geschrieben hat;
+        # ein eigener Build (auch RAG_REBUILD_INDEX) ersetzt ihn immer.
+        with build_lock(cache_dir):
+            if index.source == 'build' or not snapshot_matches(snapshot_path, key, index.model_id):
+                index.save_snapshot(snapshot_path, key)
+    return index
+
+
+def _secondary_files() -> list[str]:
+    # Sekundärindizes, die der Server mit der aktuellen Konfiguration aus dem Verzeichnis lädt.
+    files = []
+    if RAG_EMBED_REDUCTION != 'none':
+        files.append('projection.npz')
+    if RAG_INDEX_TYPE == 'ivf':
+        files.append('ivf.npz')
+    if RAG_EMBED_STORAGE == 'int8':
+        files.append('int8.npz')
+    return files
+
+
+def _directory(value: str | None) -> Path:
+    if value:
+        return Path(value)
+    if RAG_SNAPSHOT_DIR:
+        return Path(RAG_SNAPSHOT_DIR)
+    raise SystemExit('Zielverzeichnis angeben oder RAG_SNAPSHOT_DIR setzen')
+
+
+def command_build(args: argparse.Namespace) -> int:
+    directory = index_dir(_directory(args.directory))
+    directory.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    index = build_index(directory, force_rebuild=args.force)
+    stats = index.stats()
+    index.close()
+    if not args.keep_cache:
+        for name in _BUILD_ONLY:
+            path = directory / name
+            if path.is_symlink() or path.is_file():
+                path.unlink()
+            elif path.is_dir():
+                shutil.rmtree(path)
+    report = {
+        'directory': str(directory),
+        'documents': stats['documents'],
+        'source': stats['source'],
+        'seconds': round(time.perf_counter() - started, 3),
+        'key': snapshot_key(),
+        'files': {
+            path.name: path.stat().st_size for path in sorted(directory.iterdir()) if path.is_file()
+        },
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+def command_verify(args: argparse.Namespace) -> int:
+    # Prüft Prüfsummen aller Sektionen und den Schlüssel (Korpus-Signatur, Modell, Dtype, Layout, Shard).
+    directory = index_dir(_directory(args.directory))
+    path = directory / SNAPSHOT_FILE
+    expected = snapshot_key()
+    report: dict[str, object] = {'snapshot': str(path), 'expected': expected}
+    try:
+        header = verify_snapshot(path)
+    except (OSError, SnapshotError, ValueError, KeyError) as exc:
+        report.update(ok=False, error=str(exc))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 1
+    actual = header['key']
+    mismatched = sorted(name for name in set(expected) | set(actual) if expected.get(name) != actual.get(name))
+    missing = [name for name in _secondary_files() if not (directory / name).exists()]
+    report.update(
+        actual=actual,
+        # Encoder der gespeicherten Embeddings; ob er zum aktiven Encoder passt, prüft --load.
+        model_id=header['model_id'],
+        documents=header['documents'],
+        mismatched=mismatched,
+        missing=missing,
+    )
+    ok = not mismatched and not missing
+    if ok and args.load:
+        # Wie der Server: Snapshot, Sekundärindizes und Encoder read-only laden.
+        try:
+            index = build_index(directory, read_only=True)
+        except (RuntimeError, OSError, ValueError) as exc:
+            report['error'] = str(exc)
+            ok = False
+        else:
+            report['index'] = {name: index.stats()[name] for name in ('documents', 'source', 'dimension')}
+            index.close()
+    report['ok'] = ok
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if ok else 1
+
+
+def main(argv: list[str] | None = None) -> int:
+    logging.basicConfig(level=os.environ.get('RAG_LOG_LEVEL', 'INFO').upper())
+    parser = argparse.ArgumentParser(description='Index offline bauen und als Snapshot-Verzeichnis ablegen.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='Korpus laden, Embeddings und Sekundärindizes bauen, Snapshot schreiben')
+    build.add_argument('directory', nargs='?', help='Zielverzeichnis (Default: RAG_SNAPSHOT_DIR)')
+    build.add_argument('--force', action='store_true', help='vorhandenen Snapshot ignorieren und neu embedden')
+    build.add_argument(
+        '--keep-cache',
+        action='store_true',
+        help='Embedding-Cache (generations/) behalten, z. B. für inkrementelle Rebuilds',
+    )
+    build.set_defaults(func=command_build)
+
+    verify = sub.add_parser('verify', help='Snapshot gegen die aktuelle Korpus-Signatur und Konfiguration prüfen')
+    verify.add_argument('directory', nargs='?', help='Snapshot-Verzeichnis (Default: RAG_SNAPSHOT_DIR)')
+    verify.add_argument('--load', action='store_true', help='zusätzlich wie der Server read-only laden')
+    verify.set_defaults(func=command_verify)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+import numpy as np
+
+V = TypeVar('V')
+
+
+def normalize_query(text: str) -> str:
+    # Nur Whitespace vereinheitlichen: das Embedding-Modell unterscheidet Groß-/Kleinschreibung.
+    return ' '.join(text.split())
+
+
+def approximate_size(value: object) -> int:
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        # Ergebnislisten teilen sich die Dokumente mit dem Index; gezählt werden nur die Container.
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache(Generic[V]):
+    # Thread-sicherer LRU-Cache mit optionaler TTL; Größe in Einträgen begrenzt.
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float = 0.0,
+        sizeof: Callable[[object], int] = approximate_size,
+    ) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = max(0.0, ttl_seconds)
+        self._sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[V, float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def get(self, key: Hashable) -> V | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            value, stored_at, size = entry
+            if self._ttl and time.monotonic() - stored_at > self._ttl:
+                del self._entries[key]
+                self._bytes -= size
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        if not self.enabled:
+            return
+        size = self._sizeof(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            while len(self._entries) > self._max_entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self._max_entries,
+                'ttl_seconds': self._ttl,
+                'approx_bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
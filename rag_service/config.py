@@ -5,6 +5,11 @@ from pathlib import Path
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 
+
+def _env_flag(name: str, default: str = '') -> bool:
+    return os.environ.get(name, default).lower() in {'1', 'true', 'yes'}
+
+
 RAG_DATA_GLOB = os.environ.get('RAG_DATA_GLOB', '/data/*.jsonl')
 RAG_MAX_DOCS = int(os.environ.get('RAG_MAX_DOCS', '4000'))
 RAG_TOP_K_DEFAULT = int(os.environ.get('RAG_TOP_K', '4'))
@@ -12,9 +17,73 @@ RAG_EMBED_MODEL = os.environ.get(
     'RAG_EMBED_MODEL',
     'sentence-transformers/paraphrase-multilingual-mpnet-base-v2',
 )
+# JSONL-Parsing: Anzahl Prozesse (<= 1 = im Hauptprozess, Default) und Blockgröße pro Auftrag.
+# Parallel lohnt erst, wenn `bench loader` auf der Zielmaschine einen Gewinn zeigt.
+RAG_LOADER_WORKERS = max(0, int(os.environ.get('RAG_LOADER_WORKERS', '0')))
+RAG_LOADER_CHUNK_BYTES = max(1 << 16, int(os.environ.get('RAG_LOADER_CHUNK_BYTES', str(4 << 20))))
 RAG_BATCH_SIZE = max(1, int(os.environ.get('RAG_BATCH_SIZE', '24')))
+RAG_MAX_BATCH_ITEMS = max(1, int(os.environ.get('RAG_MAX_BATCH_ITEMS', '256')))
+# Gleichzeitige Einzelanfragen für bis zu N ms sammeln und gemeinsam embedden (0 = aus).
+RAG_COALESCE_WINDOW_MS = max(0.0, float(os.environ.get('RAG_COALESCE_WINDOW_MS', '0')))
+RAG_COALESCE_MAX_BATCH = max(1, int(os.environ.get('RAG_COALESCE_MAX_BATCH', '32')))
+# LRU-Caches für Query-Vektoren und fertige Ergebnislisten (Einträge, 0 = aus) mit gemeinsamer TTL.
+RAG_QUERY_CACHE_SIZE = max(0, int(os.environ.get('RAG_QUERY_CACHE_SIZE', '2048')))
+RAG_RESULT_CACHE_SIZE = max(0, int(os.environ.get('RAG_RESULT_CACHE_SIZE', '2048')))
+RAG_CACHE_TTL_SECONDS = max(0.0, float(os.environ.get('RAG_CACHE_TTL_SECONDS', '900')))
+# Eigener Inferenz-Threadpool: Worker plus begrenzte Warteschlange; bei voller Queue 503 + Retry-After.
+RAG_INFERENCE_WORKERS = max(1, int(os.environ.get('RAG_INFERENCE_WORKERS', str(min(4, os.cpu_count() or 1)))))
+RAG_INFERENCE_QUEUE = max(0, int(os.environ.get('RAG_INFERENCE_QUEUE', '64')))
+RAG_RETRY_AFTER_SECONDS = max(1, int(os.environ.get('RAG_RETRY_AFTER_SECONDS', '1')))
+# Korpus alle N Sekunden auf Änderungen prüfen und im Hintergrund neu laden (0 = nur per Admin-Endpoint).
+RAG_RELOAD_INTERVAL_SECONDS = max(0.0, float(os.environ.get('RAG_RELOAD_INTERVAL_SECONDS', '0')))
+RAG_ADMIN_TOKEN = os.environ.get('RAG_ADMIN_TOKEN', '').strip()
 RAG_CACHE_DIR = Path(os.environ.get('RAG_CACHE_DIR', ROOT_DIR / 'rag_service' / 'cache'))
-FORCE_REBUILD_INDEX = os.environ.get('RAG_REBUILD_INDEX', '').lower() in {'1', 'true', 'yes'}
+FORCE_REBUILD_INDEX = _env_flag('RAG_REBUILD_INDEX')
+# Embeddings read-only per mmap laden, damit sich mehrere Worker die Page-Cache-Seiten teilen.
+RAG_EMBED_MMAP = _env_flag('RAG_EMBED_MMAP', '1')
+# Speicherformat von embeddings.npy: float32 oder float16 (Scoring akkumuliert immer in float32).
+RAG_EMBED_DTYPE = os.environ.get('RAG_EMBED_DTYPE', 'float32').strip().lower()
+
+# Suchverfahren: exact (vollständiges Skalarprodukt) oder ivf (approximativ, für große Korpora).
+RAG_INDEX_TYPE = os.environ.get('RAG_INDEX_TYPE', 'exact').strip().lower()
+RAG_IVF_NLIST = int(os.environ.get('RAG_IVF_NLIST', '0'))
+RAG_IVF_NPROBE = int(os.environ.get('RAG_IVF_NPROBE', '8'))
+# Speicher: full (nur Vollpräzision) oder int8 (Codes im RAM, Shortlist wird exakt nachbewertet).
+RAG_EMBED_STORAGE = os.environ.get('RAG_EMBED_STORAGE', 'full').strip().lower()
+RAG_RESCORE_FACTOR = int(os.environ.get('RAG_RESCORE_FACTOR', '8'))
+# Keyword-Vorfilter: begrenzt das Dense-Scoring auf Dokumente mit gemeinsamen Termen (Fallback: voller Scan).
+RAG_SPARSE_PREFILTER = _env_flag('RAG_SPARSE_PREFILTER')
+RAG_SPARSE_MIN_HITS = int(os.environ.get('RAG_SPARSE_MIN_HITS', '32'))
+# Exakte Fragen (opt-in): wörtlich (bis auf Groß-/Kleinschreibung, Whitespace, Satzzeichen) gestellte
+# Korpusfragen treffen per Hash und stehen vorne; die übrigen top-k rankt der Dense-Pfad mit dem Query-Vektor.
+RAG_EXACT_QUESTIONS = _env_flag('RAG_EXACT_QUESTIONS')
+# Binärer Snapshot (Dokumente + Persona-Map + Embeddings): Warmstart ohne JSONL-Parsing.
+RAG_SNAPSHOT = _env_flag('RAG_SNAPSHOT', '1')
+# Mit python -m rag_service.build gebackenes Snapshot-Verzeichnis: der Server lädt es read-only und
+# embeddet zur Laufzeit keine Dokumente; passt es nicht zum Korpus, startet er nicht.
+RAG_SNAPSHOT_DIR = os.environ.get('RAG_SNAPSHOT_DIR', '').strip()
+# Index beim Import synchron bauen (z. B. gunicorn --preload), statt im Hintergrund nach dem Start.
+RAG_PRELOAD = _env_flag('RAG_PRELOAD')
+# Encoder-Backend: torch (SentenceTransformer), onnx oder onnx-int8 (ONNX Runtime, dynamisch quantisiert).
+RAG_ENCODER_BACKEND = os.environ.get('RAG_ENCODER_BACKEND', 'torch').strip().lower()
+RAG_ENCODER_MIN_COSINE = float(os.environ.get('RAG_ENCODER_MIN_COSINE', '0.99'))
+RAG_ENCODER_VERIFY_SAMPLE = int(os.environ.get('RAG_ENCODER_VERIFY_SAMPLE', '256'))
+RAG_ONNX_THREADS = int(os.environ.get('RAG_ONNX_THREADS', '0'))
+# Kalter Embedding-Build: Prozesse (<= 1 = im Hauptprozess) und Threads pro Prozess. Fertige Chunks landen als
+# Checkpoint im Cache-Verzeichnis, ein abgebrochener Build setzt dort wieder an.
+RAG_BUILD_WORKERS = max(0, int(os.environ.get('RAG_BUILD_WORKERS', '0')))
+RAG_BUILD_THREADS = max(0, int(os.environ.get('RAG_BUILD_THREADS', '0')))
+RAG_BUILD_CHECKPOINTS = _env_flag('RAG_BUILD_CHECKPOINTS', '1')
+# Dimensionsreduktion der Suchvektoren: none, pca (beim Build gefittet) oder truncate (Matryoshka-Modelle).
+RAG_EMBED_REDUCTION = os.environ.get('RAG_EMBED_REDUCTION', 'none').strip().lower()
+RAG_EMBED_REDUCED_DIM = int(os.environ.get('RAG_EMBED_REDUCED_DIM', '256'))
+# Sharding: dieser Prozess hält nur Shard RAG_SHARD_INDEX von RAG_SHARD_COUNT (Partition per hash oder persona).
+RAG_SHARD_COUNT = max(1, int(os.environ.get('RAG_SHARD_COUNT', '1')))
+RAG_SHARD_INDEX = int(os.environ.get('RAG_SHARD_INDEX', '0'))
+RAG_SHARD_MODE = os.environ.get('RAG_SHARD_MODE', 'hash').strip().lower()
+# Koordinator (rag_service.coordinator): Basis-URLs der Shards, in Shard-Reihenfolge, und Deadline pro Anfrage.
+RAG_SHARD_URLS = [url.strip().rstrip('/') for url in os.environ.get('RAG_SHARD_URLS', '').split(',') if url.strip()]
+RAG_SHARD_DEADLINE_MS = max(1.0, float(os.environ.get('RAG_SHARD_DEADLINE_MS', '800')))
 
 
 def ensure_cache_dir() -> Path:
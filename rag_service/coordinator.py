@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import httpx
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from .config import (
+    RAG_RETRY_AFTER_SECONDS,
+    RAG_SHARD_DEADLINE_MS,
+    RAG_SHARD_MODE,
+    RAG_SHARD_URLS,
+    RAG_TOP_K_DEFAULT,
+)
+from .metrics import Registry
+from .responses import COMPACT_JSON, JSON, MSGPACK, dumps, loads, msgpack, negotiate
+from .schemas import BatchQueryRequest, QueryRequest, block_text
+from .sharding import SHARD_MODES, persona_shard
+
+logging.basicConfig(level=os.environ.get('RAG_LOG_LEVEL', 'INFO').upper())
+logger = logging.getLogger(__name__)
+
+if RAG_SHARD_MODE not in SHARD_MODES:
+    raise ValueError(f'Unbekannter Shard-Modus: {RAG_SHARD_MODE}')
+
+# Basis-URLs in Shard-Reihenfolge: Position i muss RAG_SHARD_INDEX=i sein (wird in /readyz geprüft).
+SHARD_URLS: list[str] = list(RAG_SHARD_URLS)
+DEADLINE_SECONDS = RAG_SHARD_DEADLINE_MS / 1000.0
+# Zwischen Koordinator und Shards immer das kompakte Format; `block` entsteht erst beim Ausliefern.
+SHARD_ACCEPT = MSGPACK if msgpack is not None else COMPACT_JSON
+
+METRICS = Registry()
+REQUEST_SECONDS = METRICS.histogram(
+    'rag_coordinator_request_duration_seconds',
+    'Gesamtdauer einer verteilten Anfrage inklusive Zusammenführen.',
+    ('endpoint',),
+)
+SHARD_SECONDS = METRICS.histogram('rag_shard_duration_seconds', 'Antwortzeit eines Shards.', ('shard',))
+SHARD_FAILURES = METRICS.counter(
+    'rag_shard_failures_total',
+    'Shard-Antworten, die nicht in das Ergebnis eingehen (timeout, error, status).',
+    ('shard', 'reason'),
+)
+PARTIAL_RESULTS = METRICS.counter('rag_partial_results_total', 'Anfragen, bei denen mindestens ein Shard fehlte.')
+
+_client: httpx.AsyncClient | None = None
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    global _client
+    if not SHARD_URLS:
+        raise RuntimeError('RAG_SHARD_URLS ist leer – der Koordinator braucht mindestens einen Shard.')
+    # Ein Client mit Keep-Alive für alle Shards; das httpx-Timeout ist nur die Obergrenze hinter der Deadline.
+    _client = httpx.AsyncClient(
+        timeout=httpx.Timeout(max(1.0, DEADLINE_SECONDS * 2)),
+        limits=httpx.Limits(max_connections=64 * len(SHARD_URLS), max_keepalive_connections=16 * len(SHARD_URLS)),
+    )
+    try:
+        yield
+    finally:
+        await _client.aclose()
+        _client = None
+
+
+app = FastAPI(title='Ethik RAG Coordinator', version='1.0.0', lifespan=lifespan)
+
+
+def owners(persona: str | None) -> list[int]:
+    # persona-Partition: eine Persona liegt komplett auf einem Shard. Ohne Persona (oder bei hash) fragen wir alle.
+    if RAG_SHARD_MODE == 'persona' and persona:
+        return [persona_shard(persona, len(SHARD_URLS))]
+    return list(range(len(SHARD_URLS)))
+
+
+async def _call(shard: int, path: str, payload: dict[str, Any]) -> dict[str, Any]:
+    assert _client is not None
+    started = time.perf_counter()
+    response = await _client.post(f'{SHARD_URLS[shard]}{path}', json=payload, headers={'Accept': SHARD_ACCEPT})
+    SHARD_SECONDS.observe(time.perf_counter() - started, str(shard))
+    response.raise_for_status()
+    media_type = response.headers.get('content-type', JSON).split(';', 1)[0].strip()
+    return loads(response.content, media_type)
+
+
+async def scatter(path: str, payloads: dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
+    # Alle Shards parallel; was bis zur Deadline nicht da ist, wird abgebrochen und fehlt im Ergebnis.
+    tasks = {asyncio.create_task(_call(shard, path, payload)): shard for shard, payload in payloads.items()}
+    done, pending = await asyncio.wait(tasks, timeout=DEADLINE_SECONDS)
+    for task in pending:
+        task.cancel()
+        SHARD_FAILURES.inc(str(tasks[task]), 'timeout')
+    answers: dict[int, dict[str, Any]] = {}
+    for task in done:
+        shard = tasks[task]
+        exc = task.exception()
+        if exc is None:
+            answers[shard] = task.result()
+            continue
+        reason = 'status' if isinstance(exc, httpx.HTTPStatusError) else 'error'
+        SHARD_FAILURES.inc(str(shard), reason)
+        logger.warning('RAG-Shard %s (%s) fehlgeschlagen: %s', shard, SHARD_URLS[shard], exc)
+    if pending:
+        late = sorted(tasks[task] for task in pending)
+        logger.warning('RAG-Shards %s haben die Deadline von %.0f ms verpasst.', late, RAG_SHARD_DEADLINE_MS)
+    if not answers:
+        raise HTTPException(
+            status_code=503,
+            detail='Kein RAG-Shard hat rechtzeitig geantwortet',
+            headers={'Retry-After': str(RAG_RETRY_AFTER_SECONDS)},
+        )
+    if len(answers) < len(payloads):
+        PARTIAL_RESULTS.inc()
+    return answers
+
+
+def merge(
+    request: QueryRequest,
+    persona: str | None,
+    top_k: int,
+    responses: list[dict[str, Any]],
+) -> dict[str, Any]:
+    # Shards scoren mit demselben Encoder, die Kosinus-Scores sind also direkt vergleichbar. Treffer aus
+    # dem Frage-Hash-Index (exact) stehen unabhängig vom Score vorne.
+    candidates = (chunk for response in responses for chunk in response['chunks'])
+    chunks = heapq.nlargest(top_k, candidates, key=lambda chunk: (chunk.get('exact', False), chunk['score']))
+    return {
+        'persona': persona,
+        'query': request.query,
+        'top_k': top_k,
+        'chunks': chunks,
+        'total_documents': sum(int(response['total_documents']) for response in responses),
+    }
+
+
+def render(
+    payload: dict[str, Any],
+    results: list[dict[str, Any]],
+    accept: str | None,
+    answered: int,
+    asked: int,
+) -> Response:
+    media_type = negotiate(accept)
+    if media_type == JSON:
+        for result in results:
+            for chunk in result['chunks']:
+                chunk['block'] = block_text(chunk['source'], chunk['persona'], chunk['question'], chunk['answer'])
+    headers = {'X-RAG-Shards': f'{answered}/{asked}', 'Vary': 'Accept'}
+    return Response(dumps(payload, media_type), media_type=media_type, headers=headers)
+
+
+@app.post('/v1/rag/query')
+async def rag_query(request: QueryRequest, accept: str | None = Header(default=None)) -> Response:
+    started = time.perf_counter()
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail='query muss gesetzt sein')
+    persona = request.persona.lower() if request.persona else None
+    top_k = request.top_k or RAG_TOP_K_DEFAULT
+    # Jeder Shard liefert seine vollen Top-k, sonst wäre das zusammengeführte Ergebnis nicht exakt.
+    payload = request.model_dump(exclude_none=True) | {'top_k': top_k}
+    shards = owners(persona)
+    answers = await scatter('/v1/rag/query', {shard: payload for shard in shards})
+    body = merge(request, persona, top_k, list(answers.values()))
+    response = render(body, [body], accept, len(answers), len(shards))
+    REQUEST_SECONDS.observe(time.perf_counter() - started, '/v1/rag/query')
+    return response
+
+
+@app.post('/v1/rag/query:batch')
+async def rag_query_batch(request: BatchQueryRequest, accept: str | None = Header(default=None)) -> Response:
+    started = time.perf_counter()
+    items: list[tuple[str | None, int]] = []
+    positions: dict[int, list[int]] = {}
+    for position, item in enumerate(request.items):
+        if not item.query.strip():
+            raise HTTPException(status_code=400, detail=f'items[{position}].query muss gesetzt sein')
+        persona = item.persona.lower() if item.persona else None
+        items.append((persona, item.top_k or RAG_TOP_K_DEFAULT))
+        for shard in owners(persona):
+            positions.setdefault(shard, []).append(position)
+    payloads = {
+        shard: {
+            'items': [
+                request.items[position].model_dump(exclude_none=True) | {'top_k': items[position][1]}
+                for position in shard_positions
+            ],
+        }
+        for shard, shard_positions in positions.items()
+    }
+    answers = await scatter('/v1/rag/query:batch', payloads)
+    # Teilergebnisse der Shards wieder den ursprünglichen Positionen zuordnen.
+    collected: list[list[dict[str, Any]]] = [[] for _ in request.items]
+    for shard, answer in answers.items():
+        for position, result in zip(positions[shard], answer['results']):
+            collected[position].append(result)
+    results = [
+        merge(item, persona, top_k, responses)
+        for item, (persona, top_k), responses in zip(request.items, items, collected)
+    ]
+    response = render({'results': results}, results, accept, len(answers), len(payloads))
+    REQUEST_SECONDS.observe(time.perf_counter() - started, '/v1/rag/query:batch')
+    return response
+
+
+@app.get('/healthz')
+def healthcheck() -> dict[str, Any]:
+    return {
+        'status': 'ok',
+        'role': 'coordinator',
+        'mode': RAG_SHARD_MODE,
+        'shards': SHARD_URLS,
+        'deadline_ms': RAG_SHARD_DEADLINE_MS,
+        'pid': os.getpid(),
+    }
+
+
+async def _readiness(shard: int) -> dict[str, Any]:
+    assert _client is not None
+    status: dict[str, Any] = {'url': SHARD_URLS[shard], 'ready': False}
+    try:
+        response = await _client.get(f'{SHARD_URLS[shard]}/readyz', timeout=DEADLINE_SECONDS)
+        data = response.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        status['error'] = str(exc) or type(exc).__name__
+        return status
+    expected = {'index': shard, 'count': len(SHARD_URLS), 'mode': RAG_SHARD_MODE}
+    status.update(documents=data.get('documents'), shard=data.get('shard'))
+    if len(SHARD_URLS) > 1 and data.get('shard') != expected:
+        status['error'] = f'Shard-Konfiguration passt nicht, erwartet {expected}'
+        return status
+    status['ready'] = response.status_code == 200
+    return status
+
+
+@app.get('/readyz')
+async def readiness() -> JSONResponse:
+    shards = await asyncio.gather(*(_readiness(shard) for shard in range(len(SHARD_URLS))))
+    ready = all(status['ready'] for status in shards)
+    return JSONResponse({'ready': ready, 'shards': shards}, status_code=200 if ready else 503)
+
+
+@app.get('/metrics')
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(METRICS.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _spawn_local(count: int, host: str, base_port: int) -> list[subprocess.Popen]:
+    # Lokaler Testaufbau: count Shard-Prozesse auf base_port+1..base_port+count, jeweils mit eigenem Cache.
+    processes = []
+    for shard in range(count):
+        env = dict(
+            os.environ,
+            RAG_SHARD_COUNT=str(count),
+            RAG_SHARD_INDEX=str(shard),
+            RAG_SHARD_MODE=RAG_SHARD_MODE,
+            RAG_SERVICE_HOST=host,
+            RAG_SERVICE_PORT=str(base_port + 1 + shard),
+        )
+        processes.append(subprocess.Popen([sys.executable, '-m', 'rag_service.server'], env=env))
+        SHARD_URLS.append(f'http://{host}:{base_port + 1 + shard}')
+    return processes
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Scatter-Gather-Koordinator für geshardete RAG-Services.')
+    parser.add_argument('--host', default=os.environ.get('RAG_SERVICE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('RAG_SERVICE_PORT', '9400')))
+    parser.add_argument(
+        '--local-shards',
+        type=int,
+        default=0,
+        help='N Shard-Prozesse auf den folgenden Ports selbst starten (statt RAG_SHARD_URLS)',
+    )
+    args = parser.parse_args(argv)
+    processes: list[subprocess.Popen] = []
+    if args.local_shards:
+        SHARD_URLS.clear()
+        processes = _spawn_local(args.local_shards, args.host, args.port)
+    import uvicorn
+
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
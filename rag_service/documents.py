@@ -2,9 +2,27 @@ from __future__ import annotations
 
 import json
 import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import Iterable, Iterator, Sequence
+
+try:  # optional: deutlich schnellerer JSON-Decoder
+    import orjson
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def build_context(system: str, question: str, answer: str) -> str:
+    # Text, der embeddet wird: System-Prompt der Persona (falls vorhanden), Frage und Antwort.
+    if system:
+        return f'{system}\nFrage: {question}\nAntwort: {answer}'
+    return f'Frage: {question}\nAntwort: {answer}'
 
 
 @dataclass(frozen=True, slots=True)
@@ -12,9 +30,14 @@ class Document:
     persona: str
     question: str
     answer: str
-    context: str
+    system: str
     source: str
 
+    @property
+    def context(self) -> str:
+        # Wird nur beim Embedden und Hashen gebraucht, daher nicht pro Dokument gespeichert.
+        return build_context(self.system, self.question, self.answer)
+
 
 def iter_files(glob_pattern: str) -> Iterable[Path]:
     path = Path(glob_pattern)
@@ -27,39 +50,63 @@ def iter_files(glob_pattern: str) -> Iterable[Path]:
         yield path
 
 
-def _first_content(messages: Sequence[dict], role: str) -> str | None:
+_ROLES = frozenset(('system', 'user', 'assistant'))
+
+
+def _first_contents(messages: Sequence[dict]) -> dict[str, str]:
+    # Erster String-Inhalt je Rolle, in einem Durchlauf über die Nachrichten.
+    found: dict[str, str] = {}
     for message in messages:
-        if isinstance(message, dict) and message.get('role') == role:
+        if not isinstance(message, dict):
+            continue
+        role = message.get('role')
+        if role in _ROLES and role not in found:
             content = message.get('content')
             if isinstance(content, str):
-                return content.strip()
-    return None
+                found[role] = content.strip()
+                if len(found) == len(_ROLES):
+                    break
+    return found
 
 
-def line_to_document(line: str, persona: str, source: str) -> Document | None:
+def _loads(line: str) -> object:
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # orjson ist strenger (NaN, große Ints, einzelne Surrogates) – dann entscheidet json.
+            pass
+    return json.loads(line)
+
+
+def _line_to_fields(line: str) -> tuple[str, str, str] | None:
     try:
-        payload = json.loads(line)
+        payload = _loads(line)
     except json.JSONDecodeError:
         return None
+    if not isinstance(payload, dict):
+        return None
     messages = payload.get('messages')
     if not isinstance(messages, list):
         return None
-    question = _first_content(messages, 'user')
-    answer = _first_content(messages, 'assistant')
-    system = _first_content(messages, 'system')
+    contents = _first_contents(messages)
+    question = contents.get('user')
+    answer = contents.get('assistant')
     if not question or not answer:
         return None
-    context_parts = []
-    if system:
-        context_parts.append(system)
-    context_parts.append(f'Frage: {question}')
-    context_parts.append(f'Antwort: {answer}')
-    context = '\n'.join(context_parts)
+    return question.strip(), answer.strip(), contents.get('system') or ''
+
+
+def line_to_document(line: str, persona: str, source: str) -> Document | None:
+    fields = _line_to_fields(line)
+    if fields is None:
+        return None
+    question, answer, system = fields
     return Document(
         persona=persona.lower(),
-        question=question.strip(),
-        answer=answer.strip(),
-        context=context,
+        question=question,
+        answer=answer,
+        system=system,
         source=source,
     )
 
@@ -88,6 +135,155 @@ def load_documents(glob_pattern: str, limit: int) -> tuple[list[Document], list[
     return documents, used_files
 
 
+def _file_chunks(file_path: Path, chunk_bytes: int) -> list[tuple[int, int]]:
+    # Byte-Bereiche, die jeweils direkt nach einem Zeilenumbruch enden.
+    size = file_path.stat().st_size
+    chunks: list[tuple[int, int]] = []
+    start = 0
+    with file_path.open('rb') as handle:
+        while start < size:
+            end = min(size, start + chunk_bytes)
+            if end < size:
+                handle.seek(end)
+                tail = handle.readline()
+                end += len(tail)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _parse_chunk(path: str, start: int, end: int) -> list[tuple[str, str, str]] | None:
+    # None: Block nicht lesbar (Datei verschwunden, kein UTF-8) – die Datei übernimmt der sequentielle Leser.
+    try:
+        with open(path, 'rb') as handle:
+            handle.seek(start)
+            data = handle.read(end - start)
+        text = data.decode('utf-8')
+    except (OSError, UnicodeDecodeError):
+        return None
+    # Wie der Textmodus von open(): \r\n und \r gelten als Zeilenende.
+    rows: list[tuple[str, str, str]] = []
+    # Gleiche System-Prompts als ein Objekt: pickle überträgt sie dann nur einmal pro Block.
+    systems: dict[str, str] = {}
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        fields = _line_to_fields(line)
+        if fields is not None:
+            question, answer, system = fields
+            rows.append((question, answer, systems.setdefault(system, system)))
+    return rows
+
+
+def _iter_file_sequential(file_path: Path, persona: str) -> Iterator[Document]:
+    try:
+        with file_path.open('r', encoding='utf-8') as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                document = line_to_document(line, persona, str(file_path))
+                if document:
+                    yield document
+    except OSError as exc:
+        logger.warning('RAG-Datei %s nicht lesbar (%s) – übersprungen.', file_path, exc)
+    except UnicodeDecodeError:
+        return
+
+
+def iter_documents(
+    glob_pattern: str,
+    limit: int,
+    workers: int = 0,
+    chunk_bytes: int = 4 << 20,
+    used_files: list[Path] | None = None,
+) -> Iterator[Document]:
+    chunk_bytes = max(1, chunk_bytes)
+    # Liefert dieselben Dokumente in derselben Reihenfolge wie load_documents, parst die Dateien
+    # aber in Byte-Blöcken – mit workers > 1 verteilt auf einen Prozesspool – und gibt sie
+    # dateiweise aus, ohne eine Zwischenliste für den gesamten Korpus aufzubauen.
+    tasks: list[tuple[Path, int, int]] = []
+    for file_path in iter_files(glob_pattern):
+        try:
+            chunks = _file_chunks(file_path, chunk_bytes)
+        except OSError:
+            chunks = []
+        if not chunks:
+            tasks.append((file_path, 0, 0))
+        for start, end in chunks:
+            tasks.append((file_path, start, end))
+
+    # Für kleine Korpora lohnt der Prozesspool nicht.
+    total_bytes = sum(end - start for _, start, end in tasks)
+    # spawn statt fork: der Aufrufer ist oft der Reload-Thread eines Servers mit Torch-/ONNX-Threadpools.
+    pool = None
+    if workers > 1 and total_bytes > chunk_bytes:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    pending: deque[Future | list[tuple[str, str, str]] | None] = deque()
+    window = max(1, workers) * 2
+    next_task = 0
+    count = 0
+    current: Path | None = None
+    rows: list[tuple[str, str, str]] | None = []
+    try:
+        for position, (file_path, _, _) in enumerate(tasks):
+            while next_task < len(tasks) and len(pending) < window:
+                task_path, task_start, task_end = tasks[next_task]
+                if task_start == task_end:
+                    pending.append([])
+                elif pool is not None:
+                    pending.append(pool.submit(_parse_chunk, str(task_path), task_start, task_end))
+                else:
+                    pending.append(_parse_chunk(str(task_path), task_start, task_end))
+                next_task += 1
+            result = pending.popleft()
+            if isinstance(result, Future):
+                result = result.result()
+            if file_path != current:
+                current = file_path
+                rows = []
+                if used_files is not None:
+                    used_files.append(file_path)
+            if result is None:
+                rows = None
+            elif rows is not None:
+                rows.extend(result)
+            if position + 1 < len(tasks) and tasks[position + 1][0] == file_path:
+                continue
+            # Eine Datei wird erst ausgegeben, wenn alle ihre Blöcke lesbar und gültiges UTF-8 waren; sonst
+            # übernimmt der sequentielle Leser und bricht wie load_documents an der Fehlerstelle ab.
+            persona = file_path.stem.lower()
+            if rows is None:
+                documents: Iterable[Document] = _iter_file_sequential(file_path, persona)
+            else:
+                source = str(file_path)
+                documents = (
+                    Document(persona=persona, question=question, answer=answer, system=system, source=source)
+                    for question, answer, system in rows
+                )
+            for document in documents:
+                yield document
+                count += 1
+                if 0 < limit <= count:
+                    return
+            rows = []
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_documents_parallel(
+    glob_pattern: str,
+    limit: int,
+    workers: int = 0,
+    chunk_bytes: int = 4 << 20,
+) -> tuple[list[Document], list[Path]]:
+    used_files: list[Path] = []
+    documents = list(iter_documents(glob_pattern, limit, workers, chunk_bytes, used_files))
+    return documents, used_files
+
+
 def compute_corpus_signature(files: Sequence[Path], extra: str | None = None) -> str:
     parts: list[str] = []
     for file_path in files:
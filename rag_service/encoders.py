@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from .generations import build_lock
+
+try:  # optional: ONNX-Runtime-Backend für den Encoder
+    import onnxruntime
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+# Der HashEncoder ist bewusst kein Backend: er liefert keine semantischen Vektoren und dient nur Benchmarks und Tests.
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+_TOKEN = re.compile(r'\w+')
+# Bumpen, wenn sich Export oder Pooling ändern: alte Exporte werden dann neu erzeugt.
+_EXPORT_VERSION = 1
+_OPSET = 14
+
+
+def encoder_id(model_name: str, backend: str) -> str:
+    # Geht in Cache-Schlüssel ein: Dokument- und Anfragevektoren stammen immer aus demselben Backend.
+    return model_name if backend == 'torch' else f'{model_name}@{backend}'
+
+
+def describe_encoder(encoder: object) -> dict[str, object]:
+    if isinstance(encoder, OnnxEncoder):
+        return {'backend': encoder.backend, 'path': str(encoder.path), 'agreement': encoder.agreement}
+    if isinstance(encoder, HashEncoder):
+        return {'backend': 'hash', 'dimension': encoder.get_sentence_embedding_dimension(), 'agreement': None}
+    return {'backend': 'torch', 'agreement': None}
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> dict[str, float]:
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {
+        'samples': int(cosine.shape[0]),
+        'mean': round(float(cosine.mean()), 6) if cosine.size else 1.0,
+        'p01': round(float(np.quantile(cosine, 0.01)), 6) if cosine.size else 1.0,
+        'min': round(float(cosine.min()), 6) if cosine.size else 1.0,
+    }
+
+
+class HashEncoder:
+    # Deterministischer Encoder ohne Modell und Netzwerk für Benchmarks und Tests: jedes Wort landet per
+    # CRC32 mit Vorzeichen in zwei Dimensionen, der Satzvektor ist die Summe. Texte mit gemeinsamen
+    # Wörtern liegen so nah beieinander, semantisch ist das nicht.
+    def __init__(self, dimension: int = 384) -> None:
+        self._dimension = max(2, dimension)
+        self._buckets: dict[str, tuple[int, int, float, float]] = {}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def _bucket(self, token: str) -> tuple[int, int, float, float]:
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            digest = zlib.crc32(token.encode('utf-8'))
+            second = zlib.crc32(token.encode('utf-8'), 0x9E3779B9)
+            bucket = (
+                digest % self._dimension,
+                second % self._dimension,
+                1.0 if digest & 0x80000000 else -1.0,
+                0.5 if second & 0x80000000 else -0.5,
+            )
+            if len(self._buckets) < 1_000_000:
+                self._buckets[token] = bucket
+        return bucket
+
+    def encode(
+        self,
+        sentences: str | Sequence[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self._dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vector = embeddings[row]
+            for token in _TOKEN.findall(text.casefold()):
+                first, second, first_sign, second_sign = self._bucket(token)
+                vector[first] += first_sign
+                vector[second] += second_sign
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxEncoder:
+    # Transformer als ONNX-Graph in ONNX Runtime, Tokenizer und Pooling wie im SentenceTransformer.
+    # Bietet die Teilmenge von SentenceTransformer, die VectorIndex benutzt.
+    def __init__(self, directory: Path, backend: str, threads: int = 0) -> None:
+        if onnxruntime is None:
+            raise RuntimeError('onnxruntime ist nicht installiert')
+        from transformers import AutoTokenizer
+
+        config = json.loads((directory / 'encoder.json').read_text(encoding='utf-8'))
+        self.backend = backend
+        self.path = directory / _model_file(backend)
+        self.agreement: dict[str, float] | None = config['agreement'].get(backend)
+        self._pooling = config['pooling']
+        self._normalize = bool(config['normalize'])
+        self._max_seq_length = int(config['max_seq_length'])
+        self._dimension = int(config['dimension'])
+        self._tokenizer = AutoTokenizer.from_pretrained(directory)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(str(self.path), options, providers=['CPUExecutionProvider'])
+        self._inputs = [item.name for item in self._session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def encode(
+        self,
+        sentences: str | Sequence[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(texts), self._dimension), dtype=np.float32)
+        # Wie SentenceTransformer nach Länge sortieren, damit Batches wenig Padding enthalten.
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), max(1, batch_size)):
+            rows = order[start:start + batch_size]
+            tokens = self._tokenizer(
+                [texts[row] for row in rows],
+                padding=True,
+                truncation=True,
+                max_length=self._max_seq_length,
+                return_tensors='np',
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in self._inputs}
+            hidden = self._session.run(None, feed)[0]
+            embeddings[rows] = self._pool(hidden, tokens['attention_mask'])
+        if normalize_embeddings or self._normalize:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self._pooling == 'cls':
+            return hidden[:, 0]
+        mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+Encoder = SentenceTransformer | OnnxEncoder | HashEncoder
+
+
+def _model_file(backend: str) -> str:
+    return 'model.int8.onnx' if backend == 'onnx-int8' else 'model.onnx'
+
+
+def _export_dir(cache_dir: Path, model_name: str) -> Path:
+    return cache_dir / 'encoders' / re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+
+
+def _pooling_mode(model: SentenceTransformer) -> tuple[str, bool]:
+    modules = [type(module).__name__ for module in model]
+    pooling = model[1].get_config_dict() if len(model) > 1 else {}
+    if pooling.get('pooling_mode_cls_token'):
+        mode = 'cls'
+    elif pooling.get('pooling_mode_mean_tokens', True) and not pooling.get('pooling_mode_max_tokens'):
+        mode = 'mean'
+    else:
+        raise ValueError(f'Pooling {pooling} wird vom ONNX-Backend nicht unterstützt')
+    if any(name not in ('Transformer', 'Pooling', 'Normalize') for name in modules):
+        raise ValueError(f'Module {modules} werden vom ONNX-Backend nicht unterstützt')
+    return mode, 'Normalize' in modules
+
+
+def export_onnx(model: SentenceTransformer, model_name: str, directory: Path) -> None:
+    import torch
+
+    pooling, normalize = _pooling_mode(model)
+    transformer = model[0]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, auto_model: torch.nn.Module) -> None:
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    sample = transformer.tokenizer(['Was ist der Mensch?'], return_tensors='pt')
+    tmp_path = directory / f'model.{os.getpid()}.tmp.onnx'
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer.auto_model).eval(),
+            (sample['input_ids'], sample['attention_mask']),
+            str(tmp_path),
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'},
+            },
+            opset_version=_OPSET,
+        )
+    os.replace(tmp_path, directory / 'model.onnx')
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = directory / f'model.int8.{os.getpid()}.tmp.onnx'
+    quantize_dynamic(str(directory / 'model.onnx'), str(tmp_path), weight_type=QuantType.QInt8)
+    os.replace(tmp_path, directory / 'model.int8.onnx')
+    transformer.tokenizer.save_pretrained(directory)
+    config = {
+        'version': _EXPORT_VERSION,
+        'model': model_name,
+        'pooling': pooling,
+        'normalize': normalize,
+        'max_seq_length': int(model.max_seq_length),
+        'dimension': int(model.get_sentence_embedding_dimension()),
+        'agreement': {},
+    }
+    _write_config(directory, config)
+
+
+def _write_config(directory: Path, config: dict[str, object]) -> None:
+    # encoder.json markiert einen vollständigen Export: erst temporär schreiben, dann umbenennen.
+    tmp_path = directory / f'encoder.{os.getpid()}.tmp.json'
+    tmp_path.write_text(json.dumps(config, indent=2), encoding='utf-8')
+    os.replace(tmp_path, directory / 'encoder.json')
+
+
+def _read_config(directory: Path, model_name: str) -> dict[str, object] | None:
+    try:
+        config = json.loads((directory / 'encoder.json').read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if config.get('version') != _EXPORT_VERSION or config.get('model') != model_name:
+        return None
+    return config
+
+
+def load_encoder(
+    backend: str,
+    model_name: str,
+    cache_dir: Path,
+    sample: Sequence[str] = (),
+    min_cosine: float = 0.99,
+    threads: int = 0,
+) -> Encoder:
+    # Exportiert beim ersten Start ONNX (fp32 + dynamisch int8), prüft die Übereinstimmung mit PyTorch
+    # auf einer Korpus-Stichprobe und merkt sich das Ergebnis. Bei Fehlern bleibt es bei PyTorch.
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f'Unbekanntes Encoder-Backend: {backend}')
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+    if onnxruntime is None:
+        logger.warning('onnxruntime nicht installiert – Encoder-Backend %s fällt auf PyTorch zurück.', backend)
+        return SentenceTransformer(model_name)
+    directory = _export_dir(Path(cache_dir), model_name)
+    reference: SentenceTransformer | None = None
+    try:
+        config = _read_config(directory, model_name)
+        if config is None or backend not in config['agreement']:
+            # Export und Kosinus-Abgleich macht nur ein Prozess; parallel startende Worker übernehmen das Ergebnis.
+            with build_lock(directory):
+                config = _read_config(directory, model_name)
+                if config is None:
+                    started = time.perf_counter()
+                    reference = SentenceTransformer(model_name, device='cpu')
+                    export_onnx(reference, model_name, directory)
+                    logger.info(
+                        'ONNX-Export von %s nach %s (%.1fs).',
+                        model_name,
+                        directory,
+                        time.perf_counter() - started,
+                    )
+                    config = _read_config(directory, model_name)
+                if backend not in config['agreement']:
+                    if reference is None:
+                        reference = SentenceTransformer(model_name, device='cpu')
+                    texts = list(sample) or ['Was ist der Mensch?']
+                    candidate = OnnxEncoder(directory, backend, threads)
+                    config['agreement'][backend] = cosine_agreement(
+                        reference.encode(texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True),
+                        candidate.encode(texts, batch_size=32, normalize_embeddings=True),
+                    )
+                    _write_config(directory, config)
+        agreement = config['agreement'][backend]
+        if agreement['p01'] < min_cosine:
+            logger.warning(
+                'Encoder-Backend %s weicht zu stark ab (Kosinus p01=%.4f < %.4f) – nutze PyTorch.',
+                backend,
+                agreement['p01'],
+                min_cosine,
+            )
+            return reference if reference is not None else SentenceTransformer(model_name)
+        encoder = OnnxEncoder(directory, backend, threads)
+    except Exception:
+        logger.exception('Encoder-Backend %s nicht verfügbar – nutze PyTorch.', backend)
+        return reference if reference is not None else SentenceTransformer(model_name)
+    logger.info(
+        'Encoder-Backend %s aktiv (Kosinus zu PyTorch: mean=%.4f, p01=%.4f, n=%s).',
+        backend,
+        agreement['mean'],
+        agreement['p01'],
+        agreement['samples'],
+    )
+    return encoder
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+import numpy as np
+
+from .encoders import Encoder, HashEncoder, describe_encoder, load_encoder
+
+logger = logging.getLogger(__name__)
+
+# Encoder des Worker-Prozesses, gesetzt vom Initializer des Pools.
+_worker_encoder: Encoder | None = None
+
+
+def plan_chunks(sizes: np.ndarray, batch_size: int, batches_per_chunk: int) -> list[np.ndarray]:
+    # Global absteigend nach Länge sortiert (stabil) und in Batches fester Größe geschnitten. Jeder Batch
+    # hat damit unabhängig von Prozess und Chunk dieselben Texte und dasselbe Padding: serieller und
+    # paralleler Build liefern dieselbe Matrix. Ergebnis: Positionen in `sizes`, ein Array pro Chunk.
+    order = np.argsort(-np.asarray(sizes, dtype=np.int64), kind='stable')
+    step = max(1, batch_size) * max(1, batches_per_chunk)
+    return [order[start:start + step] for start in range(0, order.shape[0], step)]
+
+
+def encode_batches(encoder: Encoder, texts: Sequence[str], batch_size: int) -> np.ndarray:
+    # Ein encode()-Aufruf pro Batch, damit das Encoder-interne Sortieren den Plan nicht verändert.
+    parts = [
+        encoder.encode(
+            list(texts[start:start + batch_size]),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        )
+        for start in range(0, len(texts), max(1, batch_size))
+    ]
+    return np.concatenate(parts).astype(np.float32, copy=False)
+
+
+def worker_spec(encoder: Encoder, model_name: str, cache_dir: Path) -> tuple[object, ...]:
+    # Der Hash-Encoder wird mitgeschickt, alle anderen lädt jeder Worker selbst mit dem im Hauptprozess
+    # bereits geprüften Backend (ONNX-Export und Kosinus-Abgleich liegen dann schon im Cache).
+    if isinstance(encoder, HashEncoder):
+        return ('instance', encoder)
+    return ('load', describe_encoder(encoder)['backend'], model_name, str(cache_dir))
+
+
+def _watch_parent(parent: int) -> None:
+    # Stirbt der Hauptprozess (OOM, SIGKILL), beenden sich die Worker, statt verwaist auf Aufträge zu warten.
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    os._exit(1)
+
+
+def _init_worker(spec: tuple[object, ...], threads: int) -> None:
+    global _worker_encoder
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), daemon=True).start()
+    if threads > 0:
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:  # pragma: no cover - abhängig von der Umgebung
+            pass
+    if spec[0] == 'instance':
+        _worker_encoder = spec[1]
+    else:
+        _, backend, model_name, cache_dir = spec
+        _worker_encoder = load_encoder(
+            str(backend),
+            str(model_name),
+            Path(str(cache_dir)),
+            min_cosine=-1.0,
+            threads=threads,
+        )
+
+
+def _encode_in_worker(texts: list[str], batch_size: int) -> np.ndarray:
+    return encode_batches(_worker_encoder, texts, batch_size)
+
+
+class ChunkCheckpoints:
+    # Ein .npy pro fertigem Chunk unter <cache_dir>/build/<key>. Der Schlüssel hängt nur an Modell, Dtype,
+    # Batch-Plan und den Inhalts-Hashes der zu berechnenden Dokumente, nicht an mtimes der Korpusdateien.
+    def __init__(self, root: Path, key: str, enabled: bool = True) -> None:
+        self._directory = root / key
+        self._enabled = enabled
+        if enabled:
+            # Reste abgebrochener Builds mit anderem Schlüssel werden nie mehr fortgesetzt.
+            if root.exists():
+                for stale in root.iterdir():
+                    if stale != self._directory:
+                        shutil.rmtree(stale, ignore_errors=True)
+            self._directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: object) -> str:
+        hasher = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            hasher.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+            hasher.update(b'\x00')
+        return hasher.hexdigest()
+
+    def _path(self, chunk: int) -> Path:
+        return self._directory / f'chunk-{chunk:06d}.npy'
+
+    def has(self, chunk: int) -> bool:
+        return self._enabled and self._path(chunk).exists()
+
+    def load(self, chunk: int, rows: int, dim: int, dtype: str) -> np.ndarray | None:
+        if not self._enabled:
+            return None
+        try:
+            array = np.load(self._path(chunk))
+        except (OSError, ValueError):
+            return None
+        if array.shape != (rows, dim) or array.dtype != np.dtype(dtype):
+            return None
+        return array
+
+    def save(self, chunk: int, array: np.ndarray) -> None:
+        if not self._enabled:
+            return
+        # Erst temporär schreiben, dann umbenennen: ein Abbruch hinterlässt nie einen halben Chunk.
+        path = self._path(chunk)
+        tmp_path = path.with_name(f'{path.stem}.tmp.npy')
+        np.save(tmp_path, array)
+        tmp_path.replace(path)
+
+    def clear(self) -> None:
+        if self._enabled:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def encode_chunks(
+    encoder: Encoder,
+    texts: Callable[[np.ndarray], list[str]],
+    chunks: Sequence[np.ndarray],
+    batch_size: int,
+    dim: int,
+    dtype: str,
+    checkpoints: ChunkCheckpoints,
+    workers: int = 0,
+    threads: int = 0,
+    spec: tuple[object, ...] | None = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    # Liefert (Zeilen, Embeddings) pro Chunk in Plan-Reihenfolge. Chunks mit Checkpoint werden gelesen,
+    # nur die übrigen gerechnet, mit workers > 1 in einem Prozesspool (spawn: kein geforktes Torch).
+    todo = [chunk for chunk in range(len(chunks)) if not checkpoints.has(chunk)]
+    if len(todo) < len(chunks):
+        logger.info(
+            'Embedding-Build setzt fort: %s von %s Chunks aus Checkpoints.',
+            len(chunks) - len(todo),
+            len(chunks),
+        )
+    pool = None
+    if workers > 1 and len(todo) > 1:
+        if spec is None:
+            raise ValueError('Für den parallelen Build fehlt die Encoder-Beschreibung')
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(todo)),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(spec, threads),
+        )
+    submitted = set(todo) if pool is not None else set()
+    queue = deque(todo)
+    pending: deque[Future] = deque()
+    window = max(1, workers) * 2
+    try:
+        for chunk, rows in enumerate(chunks):
+            while pool is not None and queue and len(pending) < window:
+                pending.append(pool.submit(_encode_in_worker, texts(chunks[queue.popleft()]), batch_size))
+            if chunk in submitted:
+                encoded = pending.popleft().result()
+            else:
+                cached = checkpoints.load(chunk, rows.shape[0], dim, dtype)
+                if cached is not None:
+                    yield rows, cached
+                    continue
+                encoded = encode_batches(encoder, texts(rows), batch_size)
+            encoded = encoded.astype(dtype, copy=False)
+            checkpoints.save(chunk, encoded)
+            yield rows, encoded
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+_QUEUE_TIME_SAMPLES = 2048
+
+
+class ExecutorSaturated(RuntimeError):
+    pass
+
+
+class InferenceExecutor:
+    # Eigener Threadpool für Encoder/Scoring mit fester Obergrenze für laufende plus wartende Aufträge.
+    # Ist sie erreicht, schlägt submit sofort fehl, statt die Latenz unbegrenzt wachsen zu lassen.
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self._workers = max(1, workers)
+        self._queue_size = max(0, queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='rag-inference')
+        self._slots = threading.BoundedSemaphore(self._workers + self._queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._accepted = 0
+        self._rejected = 0
+        self._started = 0
+        self._queue_times: deque[float] = deque(maxlen=_QUEUE_TIME_SAMPLES)
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+
+    def _wrap(self, fn: Callable[..., T], args: tuple, enqueued: float) -> Callable[[], T]:
+        def task() -> T:
+            waited = time.perf_counter() - enqueued
+            with self._lock:
+                self._pending -= 1
+                self._running += 1
+                self._started += 1
+                self._queue_times.append(waited)
+                self._queue_time_total += waited
+                self._queue_time_max = max(self._queue_time_max, waited)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+
+        return task
+
+    async def run(self, fn: Callable[..., T], *args: object) -> T:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated('Inferenz-Queue ist voll')
+        with self._lock:
+            self._pending += 1
+            self._accepted += 1
+        try:
+            future = self._pool.submit(self._wrap(fn, args, time.perf_counter()))
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            samples = sorted(self._queue_times)
+            started = self._started
+
+            def percentile(fraction: float) -> float | None:
+                if not samples:
+                    return None
+                return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000.0, 3)
+
+            return {
+                'workers': self._workers,
+                'queue_size': self._queue_size,
+                'queued': self._pending,
+                'running': self._running,
+                'accepted': self._accepted,
+                'rejected': self._rejected,
+                'queue_time_mean_ms': round(self._queue_time_total / started * 1000.0, 3) if started else None,
+                'queue_time_p50_ms': percentile(0.5),
+                'queue_time_p95_ms': percentile(0.95),
+                'queue_time_p99_ms': percentile(0.99),
+                'queue_time_max_ms': round(self._queue_time_max * 1000.0, 3),
+            }
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+try:  # flock gibt es nur unter POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# <cache>/current ist ein Symlink auf generations/<name>; Embeddings, Hashes und Metadaten einer
+# Generation werden zusammen geschrieben und mit einem einzigen rename veröffentlicht.
+_CURRENT = 'current'
+_GENERATIONS = 'generations'
+_LOCK = 'build.lock'
+# Die vorige Generation bleibt liegen, damit ein Leser, der `current` gerade aufgelöst hat, sie noch öffnen kann.
+_KEEP = 2
+
+
+@contextmanager
+def build_lock(directory: Path, on_wait: Callable[[], None] | None = None) -> Iterator[None]:
+    # Exklusiver flock über Prozesse hinweg. Der Kernel gibt ihn beim Prozessende frei, auch nach SIGKILL/OOM.
+    directory.mkdir(parents=True, exist_ok=True)
+    with (directory / _LOCK).open('a+b') as handle:
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if on_wait is not None:
+                    on_wait()
+                logger.info('Anderer Prozess baut den Index (%s) – warte auf den Build-Lock ...', directory)
+                started = time.perf_counter()
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                logger.info('Build-Lock nach %.1fs erhalten.', time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def current_generation(directory: Path) -> Path | None:
+    # Einmal pro Lesevorgang auflösen und alle Dateien aus dem Ergebnis lesen: sie passen dann zusammen.
+    try:
+        target = os.readlink(directory / _CURRENT)
+    except OSError:
+        return None
+    return directory / target
+
+
+def publish_generation(directory: Path, write: Callable[[Path], None]) -> Path:
+    # Nur unter dem Build-Lock aufrufen. write() füllt ein frisches Verzeichnis, das erst nach dem
+    # vollständigen Schreiben per rename sichtbar und per Symlink-Tausch aktuell wird.
+    generations = directory / _GENERATIONS
+    generations.mkdir(parents=True, exist_ok=True)
+    name = f'{time.time_ns():x}-{os.getpid()}'
+    staging = generations / f'.{name}.tmp'
+    staging.mkdir()
+    try:
+        write(staging)
+        staging.rename(generations / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    link = directory / f'.{_CURRENT}.{os.getpid()}.tmp'
+    link.unlink(missing_ok=True)
+    os.symlink(f'{_GENERATIONS}/{name}', link)
+    os.replace(link, directory / _CURRENT)
+    # Ältere Generationen und Reste abgebrochener Builds entfernen. Prozesse, die alte Embeddings noch
+    # gemappt haben, behalten ihren Inode.
+    finished = sorted(path for path in generations.iterdir() if not path.name.startswith('.'))
+    stale = finished[:-_KEEP] + [path for path in generations.iterdir() if path.name.startswith('.')]
+    for path in stale:
+        shutil.rmtree(path, ignore_errors=True)
+    return generations / name
@@ -1,134 +1,860 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
+import threading
+import time
+from contextlib import ExitStack
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import KeysView, Sequence
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+from .ann import INDEX_TYPES, IVFIndex, measure_recall
+from .batching import EncoderBatcher
+from .cache import LRUCache, normalize_query
 from .documents import Document
+from .encoders import Encoder, describe_encoder, encoder_id, load_encoder
+from .encoding import ChunkCheckpoints, encode_chunks, plan_chunks, worker_spec
+from .generations import build_lock, current_generation, publish_generation
+from .metrics import count, stage
+from .quantization import STORAGE_MODES, Int8Quantizer
+from .reduction import REDUCTIONS, Projection
+from .progress import BuildProgress
+from .questions import QuestionIndex
+from .scoring import dot_scores, top_positions
+from .snapshot import Snapshot, write_snapshot
+from .store import DocumentStore
+from .sparse import KeywordIndex
 
 logger = logging.getLogger(__name__)
 
+STORAGE_DTYPES = ('float32', 'float16')
+# blake2b-Digest pro Dokument-Kontext, abgelegt als (N, 16) uint8 in hashes.npy.
+_HASH_BYTES = 16
+# Batches pro Build-Chunk: Einheit für Fortschritt (/readyz), Checkpoints und Aufträge im Prozesspool.
+_ENCODE_CHUNK_BATCHES = 64
+# Dokumente (und damit Embedding-Zeilen) liegen nach Persona sortiert zusammenhängend im Cache.
+LAYOUT = 'persona-contiguous-v1'
+
 
 @dataclass(frozen=True, slots=True)
 class SearchResult:
     document: Document
     score: float
+    # Treffer aus dem Frage-Hash-Index; der Koordinator stellt ihn vor alle Dense-Treffer.
+    exact: bool = False
 
 
 class VectorIndex:
     def __init__(
         self,
-        documents: Sequence[Document],
+        documents: Sequence[Document] | DocumentStore,
         cache_dir: Path,
         signature: str,
         model_name: str,
         batch_size: int,
         force_rebuild: bool = False,
+        mmap: bool = False,
+        storage_dtype: str = 'float32',
+        index_type: str = 'exact',
+        ivf_nlist: int = 0,
+        ivf_nprobe: int = 8,
+        coalesce_window_ms: float = 0.0,
+        coalesce_max_batch: int = 32,
+        query_cache: LRUCache[np.ndarray] | None = None,
+        result_cache: LRUCache[tuple[SearchResult, ...]] | None = None,
+        encoder: Encoder | None = None,
+        storage: str = 'full',
+        rescore_factor: int = 8,
+        sparse_prefilter: bool = False,
+        sparse_min_hits: int = 32,
+        snapshot: Snapshot | None = None,
+        progress: BuildProgress | None = None,
+        encoder_backend: str = 'torch',
+        encoder_verify_sample: int = 256,
+        encoder_min_cosine: float = 0.99,
+        encoder_threads: int = 0,
+        reduction: str = 'none',
+        reduced_dim: int = 256,
+        exact_questions: bool = False,
+        build_workers: int = 0,
+        build_threads: int = 0,
+        build_checkpoints: bool = False,
+        read_only: bool = False,
+        lazy_encoder: bool = False,
     ) -> None:
-        self._documents = list(documents)
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f'Unbekannter Embedding-Datentyp: {storage_dtype}')
+        if storage not in STORAGE_MODES:
+            raise ValueError(f'Unbekannter Speichermodus: {storage}')
+        if reduction not in REDUCTIONS:
+            raise ValueError(f'Unbekannte Dimensionsreduktion: {reduction}')
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f'Unbekannter Index-Typ: {index_type}')
+        if read_only and snapshot is None:
+            raise ValueError('Ein read-only Index braucht einen Snapshot')
+        started = time.perf_counter()
+        # Ein Snapshot liefert die Dokumente bereits als Spalten und nach Persona sortiert.
+        if snapshot is not None:
+            self._documents = snapshot.documents
+        else:
+            store = documents if isinstance(documents, DocumentStore) else DocumentStore.from_documents(documents)
+            self._documents = store.sorted_by_persona()
         self._signature = signature
         self._cache_dir = Path(cache_dir)
-        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        # read_only: gebackenes Snapshot-Verzeichnis (python -m rag_service.build); es wird nichts geschrieben.
+        self._read_only = read_only
+        if not read_only:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
         self._model_name = model_name
         self._batch_size = max(1, batch_size)
-        self._encoder = SentenceTransformer(self._model_name)
-        self._persona_map: dict[str, list[int]] = {}
-        for idx, doc in enumerate(self._documents):
-            self._persona_map.setdefault(doc.persona, []).append(idx)
+        # Mit int8-Codes oder reduzierten Vektoren bleibt die volle Matrix nur gemappt (Rescoring, Snapshot).
+        self._mmap = mmap or storage == 'int8' or reduction != 'none'
+        self._reduction = reduction
+        self._reduced_dim = max(1, reduced_dim)
+        self._storage_dtype = storage_dtype
+        self._storage = storage
+        self._rescore_factor = max(1, rescore_factor)
+        self._force_rebuild = force_rebuild
+        self._progress = progress if progress is not None else BuildProgress()
+        self._index_type = index_type
+        self._ivf_nlist = max(0, ivf_nlist)
+        self._ivf_nprobe = max(1, ivf_nprobe)
+        self._build_workers = max(0, build_workers)
+        self._build_threads = max(0, build_threads)
+        self._build_checkpoints = build_checkpoints
+        self._encoder_backend = encoder_backend
+        self._encoder_verify_sample = encoder_verify_sample
+        self._encoder_min_cosine = encoder_min_cosine
+        self._encoder_threads = encoder_threads
+        self._encoder_lock = threading.Lock()
+        # lazy_encoder (RAG_PRELOAD): der Master lädt nur Snapshot oder Cache; torch und ONNX Runtime
+        # starten Threadpools, die einen fork() nicht überleben. Das Modell lädt erst der Worker.
+        if encoder is None and not lazy_encoder:
+            encoder = self._load_encoder()
+        self._encoder = encoder
+        # Modell plus tatsächlich aktives Backend identifizieren alle Caches; ohne geladenen Encoder gilt
+        # das konfigurierte Backend, geprüft wird beim Laden.
+        backend = describe_encoder(encoder)['backend'] if encoder is not None else encoder_backend
+        self._model_id = encoder_id(model_name, backend)
+        # Der Snapshot-Schlüssel kennt nur das konfigurierte Backend. Ist ein anderes aktiv (Fallback auf
+        # PyTorch oder umgekehrt), passen die gespeicherten Dokumentvektoren nicht zu den Anfragevektoren.
+        if snapshot is not None and snapshot.model_id != self._model_id:
+            if read_only:
+                raise RuntimeError(
+                    f'Snapshot {snapshot.path} wurde mit {snapshot.model_id} erstellt, aktiv ist {self._model_id}'
+                )
+            logger.warning(
+                'RAG-Snapshot %s stammt von Encoder %s, aktiv ist %s – verwerfe ihn.',
+                snapshot.path,
+                snapshot.model_id,
+                self._model_id,
+            )
+            snapshot = None
+        self._batcher: EncoderBatcher | None = None
+        if coalesce_window_ms > 0:
+            self._batcher = EncoderBatcher(self._encode_texts, coalesce_window_ms, coalesce_max_batch)
+        # Beide Caches sind mit der Korpus-Signatur verschlüsselt und können daher über Reloads geteilt werden.
+        self._query_cache = query_cache if query_cache is not None else LRUCache(0)
+        self._result_cache = result_cache if result_cache is not None else LRUCache(0)
+        # Persona -> (start, stop): eine Persona-Anfrage scored eine View statt einer Kopie.
+        self._persona_map: dict[str, tuple[int, int]] = {}
         self._embeddings: np.ndarray | None = None
-        if not force_rebuild and self._load_cache():
-            logger.info('Loaded RAG embeddings from cache (%s)', self._cache_dir)
-        else:
-            self._build_and_cache()
-        if self._embeddings is None:
-            raise RuntimeError('RAG embeddings missing after initialization')
+        self._source = 'cache'
+        self._build_locked = False
+        # Muss gebaut oder ein Sekundärindex (Projektion, IVF, int8) angelernt werden, nimmt dieser Prozess
+        # den Build-Lock und hält ihn bis zum Ende der Initialisierung; parallel startende Worker warten
+        # und übernehmen danach dessen Ergebnis aus dem Cache.
+        with ExitStack() as lock:
+            self._build_stack: ExitStack | None = lock
+            if snapshot is not None:
+                self._persona_map = dict(snapshot.persona_map)
+                self._embeddings = snapshot.embeddings(self._mmap)
+                self._source = 'snapshot'
+                logger.info('Loaded RAG index from snapshot (%s)', snapshot.path)
+            else:
+                self._persona_map = self._documents.persona_ranges()
+                if not force_rebuild and self._load_cache():
+                    logger.info('Loaded RAG embeddings from cache (%s)', self._cache_dir)
+                else:
+                    generation = current_generation(self._cache_dir)
+                    self._acquire_build_lock()
+                    # Auch RAG_REBUILD_INDEX übernimmt einen Build, der während des Wartens fertig wurde.
+                    rebuilt = current_generation(self._cache_dir) != generation
+                    if (rebuilt or not force_rebuild) and self._load_cache():
+                        logger.info('Loaded RAG embeddings built by another process (%s)', self._cache_dir)
+                    else:
+                        self._source = 'build'
+                        self._build_and_cache()
+            if self._embeddings is None:
+                raise RuntimeError('RAG embeddings missing after initialization')
+            self._progress.phase('indexing')
+            self._full_embeddings = self._embeddings
+            self._projection: Projection | None = None
+            if self._reduction != 'none' and len(self._documents):
+                self._projection = self._load_or_fit_projection()
+                self._embeddings = self._projection.apply(self._full_embeddings, self._storage_dtype)
+            # IVF und int8-Codes beziehen sich auf die (ggf. reduzierten) Suchvektoren.
+            self._vector_id = self._model_id
+            if self._projection is not None:
+                self._vector_id = f'{self._model_id}|{self._reduction}{self._projection.dimension}'
+            self._ann: IVFIndex | None = None
+            if self._index_type == 'ivf' and len(self._documents):
+                self._ann = self._load_or_train_ivf()
+            self._quantizer: Int8Quantizer | None = None
+            if self._storage == 'int8' and len(self._documents):
+                self._quantizer = self._load_or_fit_int8()
+            self._build_stack = None
+        # Der Keyword-Index existiert nur mit sparse_prefilter; einzelne Anfragen können ihn dann abschalten.
+        self._sparse_prefilter = sparse_prefilter
+        self._sparse_min_hits = max(1, sparse_min_hits)
+        self._keywords: KeywordIndex | None = None
+        if sparse_prefilter and len(self._documents):
+            self._keywords = KeywordIndex.build(self._documents)
+        # Wörtlich gestellte Korpusfragen: Treffer über den Frage-Hash, ohne Encoder-Aufruf.
+        self._questions: QuestionIndex | None = None
+        if exact_questions and len(self._documents):
+            self._questions = QuestionIndex.build(self._documents)
+        self._load_seconds = time.perf_counter() - started
 
     def __len__(self) -> int:
         return len(self._documents)
 
     @property
-    def encoder(self) -> SentenceTransformer:
+    def encoder(self) -> Encoder:
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    encoder = self._load_encoder()
+                    model_id = encoder_id(self._model_name, describe_encoder(encoder)['backend'])
+                    if model_id != self._model_id:
+                        raise RuntimeError(f'RAG-Index erwartet Encoder {self._model_id}, aktiv ist {model_id}')
+                    self._encoder = encoder
         return self._encoder
 
-    def _cache_paths(self) -> tuple[Path, Path]:
-        embeddings_path = self._cache_dir / 'embeddings.npy'
-        metadata_path = self._cache_dir / 'metadata.json'
-        return embeddings_path, metadata_path
+    @property
+    def personas(self) -> KeysView[str]:
+        return self._persona_map.keys()
+
+    @property
+    def signature(self) -> str:
+        return self._signature
+
+    @property
+    def source(self) -> str:
+        return self._source
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    @property
+    def query_cache(self) -> LRUCache[np.ndarray]:
+        return self._query_cache
+
+    @property
+    def result_cache(self) -> LRUCache[tuple[SearchResult, ...]]:
+        return self._result_cache
+
+    def close(self) -> None:
+        if self._batcher is not None:
+            self._batcher.close()
+
+    def stats(self) -> dict[str, object]:
+        embeddings = self._embeddings
+        return {
+            'documents': len(self._documents),
+            'document_store': self._documents.stats(),
+            'dimension': int(embeddings.shape[1]) if embeddings is not None else None,
+            'dtype': self._storage_dtype,
+            'mmap': isinstance(embeddings, np.memmap),
+            'embeddings_bytes': int(embeddings.nbytes) if embeddings is not None else 0,
+            'source': self._source,
+            'load_seconds': round(self._load_seconds, 3),
+            'index_type': self._index_type,
+            'ivf': {
+                'nlist': self._ann.nlist,
+                'nprobe': self._ivf_nprobe,
+                'recall_at_10': self._ann.recalls.get(self._ivf_nprobe),
+            } if self._ann is not None else None,
+            'encoder': describe_encoder(self._encoder) if self._encoder is not None else {
+                'backend': self._encoder_backend,
+                'agreement': None,
+                'loaded': False,
+            },
+            'reduction': {
+                'method': self._reduction,
+                'dimension': self._projection.dimension,
+                'full_dimension': int(self._full_embeddings.shape[1]),
+                'recall_at_10': self._projection.recall,
+            } if self._projection is not None else None,
+            'storage': self._storage,
+            'int8': {
+                'codes_bytes': self._quantizer.nbytes,
+                'full_bytes': int(embeddings.shape[0] * embeddings.shape[1] * 4),
+                'saved_bytes': int(embeddings.shape[0] * embeddings.shape[1] * 4) - self._quantizer.nbytes,
+                'rescore_factor': self._rescore_factor,
+                'recall_at_10': self._quantizer.recall,
+            } if self._quantizer is not None else None,
+            'sparse': self._keywords.stats() if self._keywords is not None else None,
+            'exact_questions': self._questions.stats() if self._questions is not None else None,
+            'encoder_batching': self._batcher.stats() if self._batcher is not None else None,
+            'query_cache': self._query_cache.stats() if self._query_cache.enabled else None,
+            'result_cache': self._result_cache.stats() if self._result_cache.enabled else None,
+        }
+
+    def _cache_paths(self, directory: Path | None = None) -> tuple[Path, Path, Path]:
+        # Aktuelle Generation; ohne veröffentlichte Generation gilt das alte Layout im Cache-Verzeichnis.
+        if directory is None:
+            directory = current_generation(self._cache_dir) or self._cache_dir
+        embeddings_path = directory / 'embeddings.npy'
+        metadata_path = directory / 'metadata.json'
+        hashes_path = directory / 'hashes.npy'
+        return embeddings_path, metadata_path, hashes_path
 
     def _load_cache(self) -> bool:
-        embeddings_path, metadata_path = self._cache_paths()
+        embeddings_path, metadata_path, _ = self._cache_paths()
         if not embeddings_path.exists() or not metadata_path.exists():
             return False
         try:
             metadata = json.loads(metadata_path.read_text(encoding='utf-8'))
         except json.JSONDecodeError:
             return False
-        if metadata.get('signature') != self._signature or metadata.get('model') != self._model_name:
+        if metadata.get('signature') != self._signature or metadata.get('model') != self._model_id:
+            return False
+        if metadata.get('dtype', 'float32') != self._storage_dtype or metadata.get('layout') != LAYOUT:
             return False
         try:
-            embeddings = np.load(embeddings_path)
-        except OSError:
+            embeddings = np.load(embeddings_path, mmap_mode='r' if self._mmap else None)
+        except (OSError, ValueError):
+            return False
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(self._documents):
             return False
-        if embeddings.shape[0] != len(self._documents):
+        if embeddings.dtype != np.dtype(self._storage_dtype):
             return False
         self._embeddings = embeddings
         return True
 
+    def _previous_embeddings(self) -> tuple[np.ndarray, dict[bytes, int]] | None:
+        embeddings_path, metadata_path, hashes_path = self._cache_paths()
+        if self._force_rebuild or not hashes_path.exists():
+            return None
+        try:
+            metadata = json.loads(metadata_path.read_text(encoding='utf-8'))
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            hashes = np.load(hashes_path)
+        except (OSError, ValueError, json.JSONDecodeError):
+            return None
+        if metadata.get('model') != self._model_id or metadata.get('dtype', 'float32') != self._storage_dtype:
+            return None
+        if embeddings.ndim != 2 or hashes.shape != (embeddings.shape[0], _HASH_BYTES):
+            return None
+        rows = {digest.tobytes(): row for row, digest in enumerate(hashes)}
+        return embeddings, rows
+
+    def _load_encoder(self) -> Encoder:
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(self._documents), min(len(self._documents), self._encoder_verify_sample), replace=False)
+        return load_encoder(
+            self._encoder_backend,
+            self._model_name,
+            self._cache_dir,
+            sample=self._documents.contexts(sorted(picks)),
+            min_cosine=self._encoder_min_cosine,
+            threads=self._encoder_threads,
+        )
+
     def _build_and_cache(self) -> None:
+        if self._encoder is None:
+            raise RuntimeError(
+                f'Keine fertigen RAG-Embeddings unter {self._cache_dir} – '
+                'ohne geladenen Encoder (lazy_encoder) wird nicht gebaut'
+            )
         logger.info('Baue neue RAG-Embeddings mit %s ...', self._model_name)
-        contexts = [doc.context for doc in self._documents]
-        if not contexts:
-            dim = self._encoder.get_sentence_embedding_dimension()
-            self._embeddings = np.zeros((0, dim), dtype='float32')
-        else:
-            embeddings = self._encoder.encode(
-                contexts,
-                batch_size=self._batch_size,
-                convert_to_numpy=True,
-                show_progress_bar=len(contexts) >= 100,
-                normalize_embeddings=True,
+        hashes = np.zeros((len(self._documents), _HASH_BYTES), dtype=np.uint8)
+        for idx, doc in enumerate(self._documents):
+            hashes[idx] = np.frombuffer(_content_hash(doc.context), dtype=np.uint8)
+        dim = self._encoder.get_sentence_embedding_dimension()
+        embeddings = np.zeros((len(self._documents), dim), dtype=self._storage_dtype)
+        missing = list(range(len(self._documents)))
+        previous = self._previous_embeddings()
+        if previous is not None and previous[0].shape[1] == dim:
+            old_embeddings, old_rows = previous
+            missing = []
+            for idx, digest in enumerate(hashes):
+                row = old_rows.get(digest.tobytes())
+                if row is None:
+                    missing.append(idx)
+                else:
+                    embeddings[idx] = old_embeddings[row]
+            # Das alte mmap schließen, bevor die Cache-Datei ersetzt wird.
+            del old_embeddings, previous
+            logger.info(
+                'Inkrementeller Rebuild: %s Embeddings wiederverwendet, %s neu zu berechnen.',
+                len(self._documents) - len(missing),
+                len(missing),
             )
-            self._embeddings = embeddings.astype('float32', copy=False)
-        embeddings_path, metadata_path = self._cache_paths()
-        np.save(embeddings_path, self._embeddings)
+        self._progress.phase('encoding')
+        self._progress.embeddings(0, len(missing))
+        pending = np.asarray(missing, dtype=np.int64)
+        plan = plan_chunks(self._documents.sizes(pending), self._batch_size, _ENCODE_CHUNK_BATCHES)
+        chunks = [pending[positions] for positions in plan]
+        checkpoints = ChunkCheckpoints(
+            self._cache_dir / 'build',
+            ChunkCheckpoints.key(self._model_id, self._storage_dtype, dim, self._batch_size, hashes[pending].tobytes()),
+            enabled=self._build_checkpoints and bool(missing),
+        )
+        done = 0
+        for rows, encoded in encode_chunks(
+            self._encoder,
+            self._documents.contexts,
+            chunks,
+            self._batch_size,
+            dim,
+            self._storage_dtype,
+            checkpoints,
+            workers=self._build_workers,
+            threads=self._build_threads,
+            spec=worker_spec(self._encoder, self._model_name, self._cache_dir) if self._build_workers > 1 else None,
+        ):
+            embeddings[rows] = encoded
+            done += rows.shape[0]
+            self._progress.embeddings(done, len(missing))
+            if len(chunks) > 1:
+                logger.info('RAG-Embeddings: %s/%s berechnet.', done, len(missing))
+        self._embeddings = embeddings
         metadata = {
             'signature': self._signature,
-            'model': self._model_name,
+            'model': self._model_id,
             'size': len(self._documents),
+            'dtype': self._storage_dtype,
+            'layout': LAYOUT,
         }
-        metadata_path.write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding='utf-8')
 
-    def _candidate_indices(self, persona: str | None) -> Iterable[int]:
+        def write(directory: Path) -> None:
+            embeddings_path, metadata_path, hashes_path = self._cache_paths(directory)
+            np.save(embeddings_path, embeddings)
+            np.save(hashes_path, hashes)
+            metadata_path.write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding='utf-8')
+
+        # Embeddings, Hashes und Metadaten werden gemeinsam als neue Generation veröffentlicht.
+        published = publish_generation(self._cache_dir, write)
+        for legacy_path in self._cache_paths(self._cache_dir):
+            legacy_path.unlink(missing_ok=True)
+        # Erst nach dem Veröffentlichen: bis dahin kann ein Neustart auf den Chunks aufsetzen.
+        checkpoints.clear()
+        if self._mmap:
+            self._embeddings = np.load(self._cache_paths(published)[0], mmap_mode='r')
+
+    def save_snapshot(self, path: Path, key: dict[str, object]) -> None:
+        if self._embeddings is None or self._source == 'snapshot':
+            return
+        write_snapshot(
+            path,
+            key,
+            self._signature,
+            self._model_id,
+            self._documents,
+            self._persona_map,
+            self._full_embeddings,
+        )
+
+    def _acquire_build_lock(self) -> bool:
+        # True, wenn der Lock neu genommen wurde: ein anderer Prozess kann das Artefakt inzwischen geschrieben haben.
+        if self._build_locked:
+            return False
+        self._build_stack.enter_context(build_lock(self._cache_dir, lambda: self._progress.phase('waiting')))
+        self._build_locked = True
+        return True
+
+    def _lock_for_fit(self, path: Path) -> bool:
+        # Vor dem Anlernen eines Sekundärindex. Ein gebackener Snapshot muss alle Sekundärindizes der
+        # aktuellen Konfiguration mitbringen.
+        if self._read_only:
+            raise RuntimeError(
+                f'{path} fehlt oder passt nicht zum Snapshot – mit python -m rag_service.build neu bauen'
+            )
+        return self._acquire_build_lock()
+
+    def _load_or_fit_projection(self) -> Projection:
+        projection_path = self._cache_dir / 'projection.npz'
+        key = f'{self._signature}:{self._model_id}:{self._storage_dtype}:{LAYOUT}:{self._reduction}:{self._reduced_dim}'
+        projection = None if self._source == 'build' else Projection.load(projection_path, key)
+        if projection is None and self._lock_for_fit(projection_path):
+            projection = Projection.load(projection_path, key)
+        if projection is not None:
+            logger.info('Projektion aus Cache geladen (%s, recall@10=%s).', self._reduction, projection.recall)
+            return projection
+        full = self._full_embeddings
+        projection = Projection.fit(self._reduction, full, self._reduced_dim)
+        reduced = projection.apply(full)
+        every_id = np.arange(len(self._documents))
+
+        def approximate(query_vec: np.ndarray, k: int) -> np.ndarray:
+            return top_positions(reduced @ projection.apply(query_vec[np.newaxis])[0], k)
+
+        projection.recall = measure_recall(
+            full,
+            lambda query_vec, k: self._top_ids(every_id, query_vec, k),
+            approximate,
+        )
+        projection.save(projection_path, key)
+        logger.info(
+            'Projektion %s erstellt: %s -> %s Dimensionen, recall@10=%.3f.',
+            self._reduction,
+            full.shape[1],
+            projection.dimension,
+            projection.recall,
+        )
+        return projection
+
+    def _load_or_train_ivf(self) -> IVFIndex:
+        ivf_path = self._cache_dir / 'ivf.npz'
+        key = f'{self._signature}:{self._vector_id}:{self._storage_dtype}:{LAYOUT}:{self._ivf_nlist}'
+        ann = None if self._source == 'build' else IVFIndex.load(ivf_path, key, len(self._documents))
+        if ann is None and self._lock_for_fit(ivf_path):
+            ann = IVFIndex.load(ivf_path, key, len(self._documents))
+        if ann is not None:
+            if self._ivf_nprobe not in ann.recalls:
+                # Neues nprobe auf vorhandenen Zentroiden: recall messen und (außer read-only) mitspeichern.
+                ann.recalls[self._ivf_nprobe] = self._measure_ivf_recall(ann)
+                if not self._read_only:
+                    self._acquire_build_lock()
+                    ann.save(ivf_path, key)
+            logger.info(
+                'IVF-Index aus Cache geladen (nlist=%s, nprobe=%s, recall@10=%.3f).',
+                ann.nlist,
+                self._ivf_nprobe,
+                ann.recalls[self._ivf_nprobe],
+            )
+            return ann
+        started = time.perf_counter()
+        ann = IVFIndex.train(self._embeddings, self._ivf_nlist)
+        ann.recalls[self._ivf_nprobe] = self._measure_ivf_recall(ann)
+        ann.save(ivf_path, key)
+        logger.info(
+            'IVF-Index trainiert (nlist=%s, nprobe=%s, recall@10=%.3f, %.1fs).',
+            ann.nlist,
+            self._ivf_nprobe,
+            ann.recalls[self._ivf_nprobe],
+            time.perf_counter() - started,
+        )
+        return ann
+
+    def _measure_ivf_recall(self, ann: IVFIndex) -> float:
+        return measure_recall(
+            self._embeddings,
+            lambda query_vec, k: self._top_ids(np.arange(len(self._documents)), query_vec, k),
+            lambda query_vec, k: self._top_ids(ann.probe(query_vec, self._ivf_nprobe), query_vec, k),
+        )
+
+    def _load_or_fit_int8(self) -> Int8Quantizer:
+        int8_path = self._cache_dir / 'int8.npz'
+        key = f'{self._signature}:{self._vector_id}:{self._storage_dtype}:{LAYOUT}'
+        shape = tuple(self._embeddings.shape)
+        quantizer = None if self._source == 'build' else Int8Quantizer.load(int8_path, key, shape)
+        if quantizer is None and self._lock_for_fit(int8_path):
+            quantizer = Int8Quantizer.load(int8_path, key, shape)
+        if quantizer is not None:
+            logger.info('int8-Codes aus Cache geladen (recall@10=%s).', quantizer.recall)
+            return quantizer
+        quantizer = Int8Quantizer.fit(self._embeddings)
+        every_id = np.arange(len(self._documents))
+
+        def approximate(query_vec: np.ndarray, k: int) -> np.ndarray:
+            shortlist = np.sort(top_positions(quantizer.score(quantizer.codes, query_vec), k * self._rescore_factor))
+            return self._top_ids(shortlist, query_vec, k)
+
+        quantizer.recall = measure_recall(
+            self._embeddings,
+            lambda query_vec, k: self._top_ids(every_id, query_vec, k),
+            approximate,
+        )
+        quantizer.save(int8_path, key)
+        full_bytes = self._embeddings.shape[0] * self._embeddings.shape[1] * 4
+        logger.info(
+            'int8-Codes erstellt: %.1f MiB statt %.1f MiB float32, recall@10 nach Rescoring=%.3f.',
+            quantizer.nbytes / 2**20,
+            full_bytes / 2**20,
+            quantizer.recall,
+        )
+        return quantizer
+
+    def _top_ids(self, ids: np.ndarray, query_vec: np.ndarray, k: int) -> np.ndarray:
+        scores = dot_scores(self._embeddings[ids], query_vec)
+        return ids[top_positions(scores, k)]
+
+    def _candidate_range(self, persona: str | None) -> tuple[int, int] | None:
         if persona:
-            return self._persona_map.get(persona.lower(), [])
-        return range(len(self._documents))
+            return self._persona_map.get(persona.lower())
+        return 0, len(self._documents)
 
-    def query(self, persona: str | None, query: str, top_k: int) -> list[SearchResult]:
-        if self._embeddings is None or not query:
-            return []
-        candidates = list(self._candidate_indices(persona))
-        if not candidates:
-            return []
-        query_vec = self._encoder.encode(
-            [query],
+    def _has_candidates(self, persona: str | None) -> bool:
+        candidate_range = self._candidate_range(persona)
+        return candidate_range is not None and candidate_range[0] < candidate_range[1]
+
+    def _encode_queries(self, queries: Sequence[str]) -> np.ndarray:
+        with stage('encode'):
+            return self._encode_cached(queries)
+
+    def _encode_cached(self, queries: Sequence[str]) -> np.ndarray:
+        texts = [normalize_query(query) for query in queries]
+        vectors: list[np.ndarray | None] = [
+            self._query_cache.get((self._signature, text)) for text in texts
+        ]
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if missing:
+            if self._batcher is not None and len(missing) == 1:
+                encoded = self._batcher.encode(texts[missing[0]])[np.newaxis]
+            else:
+                encoded = self._encode_texts([texts[idx] for idx in missing])
+            for row, idx in enumerate(missing):
+                vector = encoded[row].copy()
+                vector.flags.writeable = False
+                self._query_cache.put((self._signature, texts[idx]), vector)
+                vectors[idx] = vector
+        return np.stack(vectors)
+
+    def _encode_texts(self, queries: Sequence[str]) -> np.ndarray:
+        vectors = self.encoder.encode(
+            list(queries),
+            batch_size=max(self._batch_size, len(queries)),
             convert_to_numpy=True,
             normalize_embeddings=True,
-        )[0]
-        matrix = self._embeddings[candidates]
-        scores = matrix @ query_vec
-        ranked = sorted(
-            zip(candidates, scores.tolist()),
-            key=lambda item: item[1],
-            reverse=True,
         )
+        if self._projection is not None:
+            return self._projection.apply(vectors)
+        return vectors.astype('float32', copy=False)
+
+    def _collect(
+        self,
+        scores: np.ndarray,
+        top_k: int,
+        start: int,
+        ids: np.ndarray | None = None,
+    ) -> list[SearchResult]:
         results: list[SearchResult] = []
-        for idx, score in ranked[: max(1, top_k)]:
-            if score <= 0:
+        with stage('topk'):
+            for position in top_positions(scores, top_k):
+                score = float(scores[position])
+                if score <= 0:
+                    continue
+                idx = int(ids[position]) if ids is not None else start + int(position)
+                results.append(SearchResult(self._documents[idx], score))
+        return results
+
+    def _probe(
+        self,
+        persona: str | None,
+        query_vec: np.ndarray,
+        start: int,
+        stop: int,
+        top_k: int,
+    ) -> np.ndarray | None:
+        if self._ann is None:
+            return None
+        probed = self._ann.probe(query_vec, self._ivf_nprobe)
+        if persona:
+            probed = probed[(probed >= start) & (probed < stop)]
+        # Zu wenige Treffer in den geprüften Listen: lieber exakt über die Kandidaten suchen.
+        return probed if probed.size >= top_k else None
+
+    def _rank(
+        self,
+        start: int,
+        stop: int,
+        ids: np.ndarray | None,
+        query_vec: np.ndarray,
+        top_k: int,
+    ) -> list[SearchResult]:
+        with stage('scoring'):
+            if self._quantizer is None:
+                matrix = self._embeddings[start:stop] if ids is None else self._embeddings[ids]
+                scores = dot_scores(matrix, query_vec)
+            else:
+                codes = self._quantizer.codes[start:stop] if ids is None else self._quantizer.codes[ids]
+                scores = self._quantizer.score(codes, query_vec)
+        if self._quantizer is None:
+            return self._collect(scores, top_k, start, ids)
+        return self._rescore(scores, start, ids, query_vec, top_k)
+
+    def _rescore(
+        self,
+        coarse: np.ndarray,
+        start: int,
+        ids: np.ndarray | None,
+        query_vec: np.ndarray,
+        top_k: int,
+    ) -> list[SearchResult]:
+        # Vorauswahl über die int8-Codes, danach exaktes Scoring nur für die Shortlist.
+        with stage('topk'):
+            shortlist = top_positions(coarse, top_k * self._rescore_factor)
+            rows = np.sort(start + shortlist if ids is None else ids[shortlist])
+        with stage('scoring'):
+            scores = dot_scores(self._embeddings[rows], query_vec)
+        return self._collect(scores, top_k, 0, rows)
+
+    def _prefilter(self, query: str, start: int, stop: int, top_k: int, prefilter: bool) -> np.ndarray | None:
+        if not prefilter or self._keywords is None:
+            return None
+        return self._keywords.candidates(query, start, stop, max(self._sparse_min_hits, top_k))
+
+    def _search(
+        self,
+        persona: str | None,
+        query: str,
+        query_vec: np.ndarray,
+        top_k: int,
+        prefilter: bool = False,
+    ) -> list[SearchResult]:
+        start, stop = self._candidate_range(persona)
+        top_k = max(1, top_k)
+        # Kandidatenauswahl (Keyword-Vorfilter, IVF-Probe) zählt zum Scoring.
+        with stage('scoring'):
+            ids = self._prefilter(query, start, stop, top_k, prefilter)
+            if ids is None:
+                ids = self._probe(persona, query_vec, start, stop, top_k)
+        return self._rank(start, stop, ids, query_vec, top_k)
+
+    def _exact_rows(self, persona: str | None, query: str, top_k: int) -> np.ndarray | None:
+        if self._questions is None:
+            return None
+        start, stop = self._candidate_range(persona)
+        with stage('exact'):
+            rows = self._questions.lookup(query, start, stop)
+        count('exact_hit' if rows.size else 'exact_miss')
+        return rows[:max(1, top_k)] if rows.size else None
+
+    def _exact_results(self, rows: np.ndarray, query_vec: np.ndarray | None) -> list[SearchResult]:
+        # Exakte Treffer stehen vorne und sind markiert. Füllen sie die top-k allein, gibt es keinen
+        # Query-Vektor und sie bekommen den Score 1.0; sonst scort der Query-Vektor auch sie.
+        if query_vec is None:
+            scores = np.ones(rows.size, dtype=np.float32)
+        else:
+            with stage('scoring'):
+                scores = dot_scores(self._embeddings[rows], query_vec)
+        return [SearchResult(self._documents[int(row)], float(score), exact=True) for row, score in zip(rows, scores)]
+
+    def _merge_exact(
+        self,
+        rows: np.ndarray,
+        query_vec: np.ndarray,
+        ranked: list[SearchResult],
+        top_k: int,
+    ) -> list[SearchResult]:
+        # Den Rest der top-k liefert der Dense-Pfad mit dem Query-Vektor der Anfrage.
+        results = self._exact_results(rows, query_vec)
+        found = {result.document for result in results}
+        results.extend(result for result in ranked if result.document not in found)
+        return results[:max(1, top_k)]
+
+    def _use_prefilter(self, prefilter: bool | None) -> bool:
+        return self._keywords is not None and (self._sparse_prefilter if prefilter is None else prefilter)
+
+    def _result_key(
+        self,
+        persona: str | None,
+        query: str,
+        top_k: int,
+        prefilter: bool,
+    ) -> tuple[str, str | None, str, int, bool]:
+        return self._signature, persona.lower() if persona else None, normalize_query(query), top_k, prefilter
+
+    def query(
+        self,
+        persona: str | None,
+        query: str,
+        top_k: int,
+        prefilter: bool | None = None,
+    ) -> list[SearchResult]:
+        if self._embeddings is None or not query or not self._has_candidates(persona):
+            return []
+        prefilter = self._use_prefilter(prefilter)
+        key = self._result_key(persona, query, top_k, prefilter)
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        rows = self._exact_rows(persona, query, top_k)
+        if rows is not None and rows.size >= max(1, top_k):
+            results = self._exact_results(rows, None)
+        else:
+            query_vec = self._encode_queries([query])[0]
+            extra = rows.size if rows is not None else 0
+            results = self._search(persona, query, query_vec, top_k + extra, prefilter)
+            if rows is not None:
+                results = self._merge_exact(rows, query_vec, results, top_k)
+        self._result_cache.put(key, tuple(results))
+        return results
+
+    def query_batch(
+        self,
+        items: Sequence[tuple[str | None, str, int]],
+        prefilter: Sequence[bool | None] | None = None,
+    ) -> list[list[SearchResult]]:
+        results: list[list[SearchResult]] = [[] for _ in items]
+        if self._embeddings is None:
+            return results
+        flags = [self._use_prefilter(prefilter[idx] if prefilter else None) for idx in range(len(items))]
+        pending: list[int] = []
+        for idx, (persona, query, top_k) in enumerate(items):
+            if not query or not self._has_candidates(persona):
+                continue
+            cached = self._result_cache.get(self._result_key(persona, query, top_k, flags[idx]))
+            if cached is not None:
+                results[idx] = list(cached)
+            else:
+                pending.append(idx)
+        dense: list[int] = []
+        exact: dict[int, np.ndarray] = {}
+        for idx in pending:
+            persona, query, top_k = items[idx]
+            rows = self._exact_rows(persona, query, top_k)
+            if rows is not None and rows.size >= max(1, top_k):
+                results[idx] = self._exact_results(rows, None)
                 continue
-            results.append(SearchResult(self._documents[idx], float(score)))
+            if rows is not None:
+                exact[idx] = rows
+            dense.append(idx)
+        vectors = self._encode_queries([items[idx][1] for idx in dense]) if dense else None
+        # Exakte Anfragen mit gleichem Kandidatenbereich teilen sich ein Matrix-Matrix-Produkt.
+        groups: dict[tuple[int, int], list[int]] = {}
+        for row, idx in enumerate(dense):
+            persona, query, top_k = items[idx]
+            top_k = max(1, top_k) + (exact[idx].size if idx in exact else 0)
+            start, stop = self._candidate_range(persona)
+            with stage('scoring'):
+                ids = self._prefilter(query, start, stop, top_k, flags[idx])
+            if ids is not None:
+                results[idx] = self._rank(start, stop, ids, vectors[row], top_k)
+            elif self._ann is not None:
+                results[idx] = self._search(persona, query, vectors[row], top_k)
+            else:
+                groups.setdefault((start, stop), []).append(row)
+        for (start, stop), rows in groups.items():
+            queries = np.ascontiguousarray(vectors[rows].T)
+            with stage('scoring'):
+                if self._quantizer is None:
+                    scores = dot_scores(self._embeddings[start:stop], queries)
+                else:
+                    scores = self._quantizer.score(self._quantizer.codes[start:stop], queries)
+            for column, row in enumerate(rows):
+                idx = dense[row]
+                top_k = max(1, items[idx][2]) + (exact[idx].size if idx in exact else 0)
+                if self._quantizer is None:
+                    results[idx] = self._collect(scores[:, column], top_k, start)
+                else:
+                    results[idx] = self._rescore(scores[:, column], start, None, vectors[row], top_k)
+        for row, idx in enumerate(dense):
+            if idx in exact:
+                results[idx] = self._merge_exact(exact[idx], vectors[row], results[idx], items[idx][2])
+        for idx in pending:
+            self._result_cache.put(self._result_key(*items[idx], flags[idx]), tuple(results[idx]))
         return results
+
+
+def _content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=_HASH_BYTES).digest()
+
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence
+
+# Obergrenzen in Sekunden; deckt Cache-Treffer (<1 ms) bis zu überlasteten Encodern ab.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGES = ('exact', 'encode', 'scoring', 'topk')
+
+_local = threading.local()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self._help = help_text
+        self._labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self._help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self._labels, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    # Kumulative Buckets wie im Prometheus-Textformat; pro Labelkombination nur Zähler, keine Samples.
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self._help = help_text
+        self._labels = tuple(labels)
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        position = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self._buckets) + 1), [0.0])
+            series[0][position] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[0]) if series is not None else 0
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self._help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((labels, list(counts), total[0]) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket = _labels(self._labels, labels, f'le="{_number(bound)}"')
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self._labels, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self._labels, labels)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    # Wert wird erst beim Rendern berechnet, z. B. eine Quote aus zwei Countern.
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float | None]) -> None:
+        self.name = name
+        self._help = help_text
+        self._fn = fn
+
+    def render(self) -> list[str]:
+        value = self._fn()
+        lines = [f'# HELP {self.name} {self._help}', f'# TYPE {self.name} gauge']
+        if value is not None:
+            lines.append(f'{self.name} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram | Gauge] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float | None]) -> Gauge:
+        metric = Gauge(name, help_text, fn)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    # Addiert die Dauer auf die Stage-Zeiten des laufenden record(); ohne aktive Aufzeichnung fast kostenlos.
+    timings: dict[str, float] | None = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def count(name: str) -> None:
+    # Zählt ein Ereignis (z. B. einen Fast-Path-Treffer) im laufenden record(), neben den Stage-Zeiten.
+    timings: dict[str, float] | None = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + 1
+
+
+@contextmanager
+def record() -> Iterator[dict[str, float]]:
+    # Sammelt Stage-Zeiten und Ereigniszähler des aktuellen Threads, z. B. innerhalb eines Inferenz-Auftrags.
+    previous = getattr(_local, 'timings', None)
+    timings: dict[str, float] = {}
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
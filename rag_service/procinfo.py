@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import os
+import resource
+
+
+def _statm() -> list[int] | None:
+    try:
+        with open('/proc/self/statm', 'r', encoding='ascii') as handle:
+            return [int(value) for value in handle.read().split()]
+    except (OSError, ValueError):
+        return None
+
+
+def memory_usage() -> dict[str, int | None]:
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    statm = _statm()
+    rss = statm[1] * page_size if statm and len(statm) > 2 else None
+    shared = statm[2] * page_size if statm and len(statm) > 2 else None
+    # ru_maxrss ist unter Linux in KiB angegeben.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        'rss_bytes': rss,
+        'rss_shared_bytes': shared,
+        'rss_private_bytes': rss - shared if rss is not None and shared is not None else None,
+        'peak_rss_bytes': peak,
+    }
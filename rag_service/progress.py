@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import threading
+import time
+
+PHASES = ('pending', 'loading', 'waiting', 'encoding', 'indexing', 'done', 'failed')
+
+
+class BuildProgress:
+    # Fortschritt des aktuellen (oder letzten) Index-Builds für /readyz. Geschrieben wird nur vom Build-Thread,
+    # gelesen von beliebigen Request-Threads.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._phase = 'pending'
+        self._documents = 0
+        self._embeddings_total = 0
+        self._embeddings_done = 0
+        self._started_at: float | None = None
+        self._phase_started_at: float | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            self._phase = 'loading'
+            self._documents = 0
+            self._embeddings_total = 0
+            self._embeddings_done = 0
+            self._started_at = self._phase_started_at = time.perf_counter()
+
+    def phase(self, phase: str) -> None:
+        if phase not in PHASES:
+            raise ValueError(f'Unbekannte Build-Phase: {phase}')
+        with self._lock:
+            self._phase = phase
+            self._phase_started_at = time.perf_counter()
+
+    def documents(self, count: int) -> None:
+        with self._lock:
+            self._documents = count
+
+    def embeddings(self, done: int, total: int) -> None:
+        with self._lock:
+            self._embeddings_done = done
+            self._embeddings_total = total
+
+    def stats(self) -> dict[str, object]:
+        now = time.perf_counter()
+        with self._lock:
+            return {
+                'phase': self._phase,
+                'documents': self._documents,
+                'embeddings_done': self._embeddings_done,
+                'embeddings_total': self._embeddings_total,
+                'elapsed_seconds': round(now - self._started_at, 3) if self._started_at is not None else None,
+                'phase_seconds': round(now - self._phase_started_at, 3) if self._phase_started_at is not None else None,
+            }
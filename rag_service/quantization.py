@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+STORAGE_MODES = ('full', 'int8')
+_BLOCK_ROWS = 16384
+
+
+# Symmetrische skalare int8-Quantisierung mit einer Skala pro Dimension: x ≈ code * scale.
+class Int8Quantizer:
+    def __init__(self, scale: np.ndarray, codes: np.ndarray) -> None:
+        self.scale = scale.astype(np.float32, copy=False)
+        self.codes = codes
+        self.recall: float | None = None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scale.nbytes)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray) -> Int8Quantizer:
+        max_abs = np.zeros(embeddings.shape[1], dtype=np.float32)
+        for start in range(0, embeddings.shape[0], _BLOCK_ROWS):
+            block = np.abs(np.asarray(embeddings[start:start + _BLOCK_ROWS], dtype=np.float32))
+            np.maximum(max_abs, block.max(axis=0), out=max_abs)
+        scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        for start in range(0, embeddings.shape[0], _BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + _BLOCK_ROWS], dtype=np.float32) / scale
+            codes[start:start + block.shape[0]] = np.clip(np.rint(block), -127, 127)
+        return cls(scale, codes)
+
+    def score(self, codes: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+        # query_vec ist (D,) oder (D, B); die Skala wird einmal in die Anfrage multipliziert.
+        scaled = query_vec * (self.scale if query_vec.ndim == 1 else self.scale[:, np.newaxis])
+        scores = np.empty((codes.shape[0],) + query_vec.shape[1:], dtype=np.float32)
+        for start in range(0, codes.shape[0], _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            scores[start:start + block.shape[0]] = block.astype(np.float32) @ scaled
+        return scores
+
+    def save(self, path: Path, key: str) -> None:
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez(
+            tmp_path,
+            key=np.array(key),
+            scale=self.scale,
+            codes=self.codes,
+            recall=np.array(np.nan if self.recall is None else self.recall),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, key: str, shape: tuple[int, int]) -> Int8Quantizer | None:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['key']) != key:
+                    return None
+                quantizer = cls(data['scale'], data['codes'])
+                recall = float(data['recall'])
+        except (OSError, ValueError, KeyError):
+            return None
+        if quantizer.codes.shape != shape or quantizer.codes.dtype != np.int8:
+            return None
+        quantizer.recall = None if math.isnan(recall) else recall
+        return quantizer
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import re
+import threading
+
+import numpy as np
+
+from .store import DocumentStore
+
+# Alles außer Buchstaben und Ziffern (Whitespace, Satzzeichen, Unterstriche) fällt beim Vergleich weg.
+_STRIP = re.compile(r'[\W_]+')
+
+
+def normalize_question(text: str) -> str:
+    return _STRIP.sub('', text.casefold())
+
+
+def _key(normalized: str) -> int:
+    # Der Index lebt nur im Prozess, daher reicht hash(); Kollisionen werden beim Lookup aussortiert.
+    return hash(normalized) & 0xFFFF_FFFF_FFFF_FFFF
+
+
+class QuestionIndex:
+    # Hash der normalisierten Frage -> Dokument-Ids, als zwei nach Hash sortierte Arrays
+    # (12 Byte pro Dokument: uint64-Hash plus int32-Id).
+    # Da die Dokumente nach Persona sortiert sind, ist der Persona-Filter ein Bereichstest auf den Ids.
+    def __init__(self, documents: DocumentStore, keys: np.ndarray, rows: np.ndarray) -> None:
+        self._documents = documents
+        self._keys = keys
+        self._rows = rows
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    @classmethod
+    def build(cls, documents: DocumentStore) -> QuestionIndex:
+        keys: list[int] = []
+        rows: list[int] = []
+        for idx, question in enumerate(documents.questions()):
+            normalized = normalize_question(question)
+            if normalized:
+                keys.append(_key(normalized))
+                rows.append(idx)
+        key_array = np.array(keys, dtype=np.uint64)
+        order = np.argsort(key_array, kind='stable')
+        return cls(documents, key_array[order], np.array(rows, dtype=np.int32)[order])
+
+    def lookup(self, text: str, start: int, stop: int) -> np.ndarray:
+        # Aufsteigende Ids aller Dokumente in [start, stop) mit gleicher normalisierter Frage.
+        normalized = normalize_question(text)
+        found = np.empty(0, dtype=np.int64)
+        if normalized:
+            key = np.uint64(_key(normalized))
+            lo, hi = np.searchsorted(self._keys, key, side='left'), np.searchsorted(self._keys, key, side='right')
+            # Stabil sortiert: innerhalb eines Hashes sind die Ids aufsteigend.
+            rows = self._rows[lo:hi]
+            rows = rows[(rows >= start) & (rows < stop)]
+            # Hash-Kollisionen ausschließen: die Frage wird gegen den gespeicherten Text geprüft.
+            found = np.array(
+                [row for row in rows.tolist() if normalize_question(self._documents.question(row)) == normalized],
+                dtype=np.int64,
+            )
+        with self._lock:
+            self._lookups += 1
+            self._hits += bool(found.size)
+        return found
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                'questions': int(self._keys.size),
+                'bytes': int(self._keys.nbytes + self._rows.nbytes),
+                'lookups': self._lookups,
+                'hits': self._hits,
+                'hit_ratio': round(self._hits / self._lookups, 4) if self._lookups else None,
+            }
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+REDUCTIONS = ('none', 'pca', 'truncate')
+_BLOCK_ROWS = 16384
+
+
+class Projection:
+    # Lineare Abbildung auf weniger Dimensionen, danach neu normiert, damit das Skalarprodukt Kosinus bleibt.
+    # pca: zentrieren und auf die Hauptkomponenten projizieren; truncate: die ersten Dimensionen behalten
+    # (nur sinnvoll für Matryoshka-trainierte Modelle).
+    def __init__(self, method: str, mean: np.ndarray, components: np.ndarray) -> None:
+        self.method = method
+        self.mean = mean.astype(np.float32, copy=False)
+        self.components = components.astype(np.float32, copy=False)
+        self.recall: float | None = None
+
+    @property
+    def dimension(self) -> int:
+        return int(self.components.shape[0])
+
+    @classmethod
+    def fit(cls, method: str, embeddings: np.ndarray, dimension: int) -> Projection:
+        full = embeddings.shape[1]
+        dimension = max(1, min(dimension, full))
+        if method == 'truncate':
+            return cls(method, np.zeros(full, dtype=np.float32), np.eye(full, dtype=np.float32)[:dimension])
+        if method != 'pca':
+            raise ValueError(f'Unbekannte Dimensionsreduktion: {method}')
+        # Kovarianz blockweise aufsummieren: auch gemappte float16-Matrizen werden nie komplett kopiert.
+        rows = max(1, embeddings.shape[0])
+        total = np.zeros(full, dtype=np.float64)
+        gram = np.zeros((full, full), dtype=np.float64)
+        for start in range(0, embeddings.shape[0], _BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + _BLOCK_ROWS], dtype=np.float64)
+            total += block.sum(axis=0)
+            gram += block.T @ block
+        mean = total / rows
+        covariance = gram / rows - np.outer(mean, mean)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:dimension]
+        return cls(method, mean, eigenvectors[:, order].T)
+
+    def apply(self, matrix: np.ndarray, dtype: str = 'float32') -> np.ndarray:
+        reduced = np.empty((matrix.shape[0], self.dimension), dtype=dtype)
+        for start in range(0, matrix.shape[0], _BLOCK_ROWS):
+            if self.method == 'truncate':
+                block = np.array(matrix[start:start + _BLOCK_ROWS, :self.dimension], dtype=np.float32)
+            else:
+                block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32) - self.mean
+                block = block @ self.components.T
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            reduced[start:start + block.shape[0]] = block
+        return reduced
+
+    def save(self, path: Path, key: str) -> None:
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez(
+            tmp_path,
+            key=np.array(key),
+            method=np.array(self.method),
+            mean=self.mean,
+            components=self.components,
+            recall=np.array(np.nan if self.recall is None else self.recall),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, key: str) -> Projection | None:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['key']) != key:
+                    return None
+                projection = cls(str(data['method']), data['mean'], data['components'])
+                recall = float(data['recall'])
+        except (OSError, ValueError, KeyError):
+            return None
+        projection.recall = None if math.isnan(recall) else recall
+        return projection
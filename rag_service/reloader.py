@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from .index import VectorIndex
+from .progress import BuildProgress
+
+logger = logging.getLogger(__name__)
+
+
+class IndexReloader:
+    # Hält den aktuell aktiven VectorIndex. Ein Reload baut im Hintergrund einen neuen Index und
+    # tauscht die Referenz danach atomar aus; laufende Anfragen arbeiten mit ihrem alten Index weiter.
+    # Ohne Startindex ist der Dienst nicht bereit, bis der erste Build (load oder reload) durch ist.
+    def __init__(
+        self,
+        index: VectorIndex | None,
+        build: Callable[[VectorIndex | None, BuildProgress], VectorIndex],
+        corpus_state: Callable[[], str],
+    ) -> None:
+        self._index = index
+        self._build = build
+        self._corpus_state = corpus_state
+        self._observed_state = corpus_state() if index is not None else None
+        # Korpusstand des letzten fehlgeschlagenen Reloads: der Watcher versucht es erst nach der nächsten
+        # Änderung erneut, statt den vollen Rebuild in jedem Intervall zu wiederholen.
+        self._failed_state: str | None = None
+        self._progress = BuildProgress()
+        self._ready_at: float | None = time.perf_counter() if index is not None else None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._reloads = 0
+        self._failures = 0
+        self._last_error: str | None = None
+        self._last_reload_at: float | None = None
+        self._last_duration: float | None = None
+
+    @property
+    def index(self) -> VectorIndex | None:
+        return self._index
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    @property
+    def ready_at(self) -> float | None:
+        return self._ready_at
+
+    @property
+    def progress(self) -> BuildProgress:
+        return self._progress
+
+    @property
+    def reloading(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def reload(self, reason: str) -> bool:
+        with self._lock:
+            if self.reloading:
+                return False
+            self._thread = threading.Thread(target=self._run, args=(reason,), name='rag-reload', daemon=True)
+            self._thread.start()
+            return True
+
+    def load(self, reason: str) -> bool:
+        # Synchroner Build im aufrufenden Thread, z. B. im Master-Prozess vor dem Forken der Worker.
+        with self._lock:
+            if self.reloading:
+                return False
+        self._run(reason)
+        return self.ready
+
+    def _run(self, reason: str) -> None:
+        logger.info('RAG-Reload gestartet (%s).', reason)
+        started = time.perf_counter()
+        self._progress.start()
+        state = None
+        try:
+            state = self._corpus_state()
+            fresh = self._build(self._index, self._progress)
+        except Exception as exc:
+            self._failed_state = state
+            self._failures += 1
+            self._last_error = f'{type(exc).__name__}: {exc}'
+            self._progress.phase('failed')
+            logger.exception('RAG-Reload fehlgeschlagen – alter Index bleibt aktiv.')
+            return
+        previous, self._index = self._index, fresh
+        self._observed_state = state
+        self._failed_state = None
+        self._progress.phase('done')
+        if self._ready_at is None:
+            self._ready_at = time.perf_counter()
+        if previous is not None:
+            previous.close()
+        self._reloads += 1
+        self._last_error = None
+        self._last_reload_at = time.time()
+        self._last_duration = time.perf_counter() - started
+        logger.info('RAG-Reload abgeschlossen (%s Dokumente, %.1fs).', len(fresh), self._last_duration)
+
+    def watch(self, interval: float) -> None:
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._poll, args=(interval,), name='rag-watch', daemon=True)
+        self._watcher.start()
+
+    def _poll(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                state = self._corpus_state()
+            except OSError:
+                continue
+            if state not in (self._observed_state, self._failed_state) and not self.reloading:
+                self.reload('Korpus geändert')
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict[str, object]:
+        return {
+            'reloading': self.reloading,
+            'reloads': self._reloads,
+            'failures': self._failures,
+            'last_error': self._last_error,
+            'last_reload_at': self._last_reload_at,
+            'last_duration_seconds': round(self._last_duration, 3) if self._last_duration is not None else None,
+            'watch': self._watcher is not None,
+            'progress': self._progress.stats(),
+        }
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any, Sequence
+
+try:  # optional: binäres Antwortformat
+    import msgpack
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    msgpack = None
+
+try:  # optional: deutlich schnellerer JSON-Encoder
+    import orjson
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    orjson = None
+
+from .schemas import DocumentChunk, QueryResponse, format_block
+
+if TYPE_CHECKING:  # der Koordinator nutzt dieses Modul ohne Index und Encoder
+    from .index import SearchResult
+
+JSON = 'application/json'
+# Schlankes Format: gleiche Struktur wie JSON, aber ohne `block` – der Client setzt ihn aus den Feldern zusammen.
+COMPACT_JSON = 'application/vnd.rag.compact+json'
+MSGPACK = 'application/msgpack'
+_MSGPACK_ALIASES = frozenset((MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack'))
+
+
+def negotiate(accept: str | None) -> str:
+    # Bevorzugt wird das erste unterstützte kompakte Format im Accept-Header; Gewichte (q=) werden ignoriert.
+    if not accept:
+        return JSON
+    for part in accept.split(','):
+        media_type = part.split(';', 1)[0].strip().lower()
+        if media_type in _MSGPACK_ALIASES and msgpack is not None:
+            return MSGPACK
+        if media_type == COMPACT_JSON:
+            return COMPACT_JSON
+    return JSON
+
+
+def build_response(
+    query: str,
+    persona: str | None,
+    top_k: int,
+    results: Sequence[SearchResult],
+    total_documents: int,
+) -> QueryResponse:
+    chunks = [
+        DocumentChunk(
+            persona=result.document.persona,
+            source=result.document.source,
+            question=result.document.question,
+            answer=result.document.answer,
+            score=result.score,
+            block=format_block(result.document),
+            exact=result.exact,
+        )
+        for result in results
+    ]
+    return QueryResponse(
+        persona=persona,
+        query=query,
+        top_k=top_k,
+        chunks=chunks,
+        total_documents=total_documents,
+    )
+
+
+def compact_response(
+    query: str,
+    persona: str | None,
+    top_k: int,
+    results: Sequence[SearchResult],
+    total_documents: int,
+) -> dict[str, Any]:
+    # Reine dicts ohne Pydantic-Validierung; die Felder kommen unverändert aus dem Index.
+    return {
+        'persona': persona,
+        'query': query,
+        'top_k': top_k,
+        'chunks': [
+            {
+                'persona': result.document.persona,
+                'source': result.document.source,
+                'question': result.document.question,
+                'answer': result.document.answer,
+                'score': result.score,
+                'exact': result.exact,
+            }
+            for result in results
+        ],
+        'total_documents': total_documents,
+    }
+
+
+def dumps(payload: Any, media_type: str) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: bytes, media_type: str) -> Any:
+    if media_type == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return orjson.loads(data) if orjson is not None else json.loads(data)
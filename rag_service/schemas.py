@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, Field
+
+from .config import RAG_MAX_BATCH_ITEMS
+from .documents import Document
+
+
+def block_text(source: str, persona: str, question: str, answer: str) -> str:
+    return (
+        f'Quelle: {source} (Persona: {persona})\n'
+        f'Frage: {question}\n'
+        f'Antwort: {answer}'
+    )
+
+
+def format_block(doc: Document) -> str:
+    return block_text(doc.source, doc.persona, doc.question, doc.answer)
+
+
+class DocumentChunk(BaseModel):
+    persona: str
+    source: str
+    question: str
+    answer: str
+    score: float
+    block: str
+    # Wörtlich gestellte Korpusfrage (Frage-Hash-Index): steht vor allen Dense-Treffern.
+    exact: bool = False
+
+
+class QueryRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    persona: str | None = None
+    top_k: int | None = Field(default=None, ge=1, le=20)
+    # None übernimmt RAG_SPARSE_PREFILTER; false erzwingt den vollen Scan.
+    prefilter: bool | None = None
+
+
+class QueryResponse(BaseModel):
+    persona: str | None
+    query: str
+    top_k: int
+    chunks: list[DocumentChunk]
+    total_documents: int
+
+
+class BatchQueryRequest(BaseModel):
+    items: list[QueryRequest] = Field(..., min_length=1, max_length=RAG_MAX_BATCH_ITEMS)
+
+
+class BatchQueryResponse(BaseModel):
+    results: list[QueryResponse]
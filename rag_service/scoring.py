@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import numpy as np
+
+# Zeilen pro Block, wenn float16-Embeddings zum Scoren nach float32 konvertiert werden.
+_SCORE_BLOCK_ROWS = 16384
+
+
+# Skalarprodukt gegen alle Zeilen; query_vec ist ein Vektor (D,) oder eine Matrix (D, B) für Batch-Anfragen.
+def dot_scores(matrix: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+    if matrix.dtype == np.float32:
+        return matrix @ query_vec
+    scores = np.empty((matrix.shape[0],) + query_vec.shape[1:], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _SCORE_BLOCK_ROWS):
+        block = matrix[start:start + _SCORE_BLOCK_ROWS]
+        scores[start:start + block.shape[0]] = block.astype(np.float32) @ query_vec
+    return scores
+
+
+# Positionen der k besten Scores, absteigend und bei Gleichstand stabil sortiert.
+def top_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        positions = np.argpartition(-scores, k - 1)[:k]
+    else:
+        positions = np.arange(scores.shape[0])
+    return positions[np.argsort(-scores[positions], kind='stable')]
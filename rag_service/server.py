@@ -1,28 +1,47 @@
 from __future__ import annotations
 
+import gc
 import logging
 import os
-from typing import Any
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, TypeVar
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
+from .build import SHARD, build_index, corpus_state, index_dir
 from .config import (
     FORCE_REBUILD_INDEX,
-    RAG_BATCH_SIZE,
-    RAG_CACHE_DIR,
+    RAG_ADMIN_TOKEN,
     RAG_DATA_GLOB,
     RAG_EMBED_MODEL,
+    RAG_INFERENCE_QUEUE,
+    RAG_INFERENCE_WORKERS,
     RAG_MAX_DOCS,
+    RAG_PRELOAD,
+    RAG_RELOAD_INTERVAL_SECONDS,
+    RAG_RETRY_AFTER_SECONDS,
+    RAG_SNAPSHOT,
+    RAG_SNAPSHOT_DIR,
     RAG_TOP_K_DEFAULT,
     ensure_cache_dir,
 )
-from .documents import Document, compute_corpus_signature, load_documents
+from .executor import ExecutorSaturated, InferenceExecutor
 from .index import VectorIndex
+from .metrics import STAGES, Registry, record
+from .procinfo import memory_usage
+from .progress import BuildProgress
+from .reloader import IndexReloader
+from .responses import JSON, build_response, compact_response, dumps, negotiate
+from .schemas import BatchQueryRequest, BatchQueryResponse, QueryRequest, QueryResponse
 
 logging.basicConfig(level=os.environ.get('RAG_LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
+T = TypeVar('T')
 
+STARTUP_STARTED = time.perf_counter()
 logger.info(
     'Initialisiere RAG-Service (glob=%s, max_docs=%s, model=%s)...',
     RAG_DATA_GLOB,
@@ -30,89 +49,271 @@ logger.info(
     RAG_EMBED_MODEL,
 )
 
-DOCUMENTS, FILES = load_documents(RAG_DATA_GLOB, RAG_MAX_DOCS)
-if not DOCUMENTS:
-    logger.warning('Keine RAG-Daten gefunden unter %s – Service liefert leere Antworten.', RAG_DATA_GLOB)
-SIGNATURE = compute_corpus_signature(FILES, str(len(DOCUMENTS)))
-CACHE_DIR = ensure_cache_dir()
-INDEX = VectorIndex(
-    DOCUMENTS,
-    cache_dir=CACHE_DIR,
-    signature=SIGNATURE,
-    model_name=RAG_EMBED_MODEL,
-    batch_size=RAG_BATCH_SIZE,
-    force_rebuild=FORCE_REBUILD_INDEX,
+# Gebackener Snapshot: read-only gemountet und unverändert genutzt, sonst der beschreibbare Cache.
+BAKED = bool(RAG_SNAPSHOT_DIR)
+CACHE_DIR = index_dir(Path(RAG_SNAPSHOT_DIR) if BAKED else ensure_cache_dir())
+if not BAKED:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def load_index(previous: VectorIndex | None = None, progress: BuildProgress | None = None) -> VectorIndex:
+    # RAG_REBUILD_INDEX gilt nur für den ersten Build eines Prozesses, nicht für spätere Reloads.
+    return build_index(
+        CACHE_DIR,
+        previous,
+        progress,
+        force_rebuild=FORCE_REBUILD_INDEX and previous is None and not BAKED,
+        use_snapshot=RAG_SNAPSHOT,
+        read_only=BAKED,
+        lazy_encoder=RAG_PRELOAD and previous is None,
+    )
+
+
+STATE = IndexReloader(None, load_index, corpus_state)
+if RAG_PRELOAD:
+    # Vor dem Forken laden (gunicorn --preload): Worker teilen Dokumente und Embeddings copy-on-write.
+    # Der Master lädt dabei kein Modell und encodet nichts (Threadpools von torch/ONNX Runtime überleben
+    # keinen fork()); fehlen Snapshot bzw. Embedding-Cache, bricht er ab. gc.freeze verhindert, dass der
+    # zyklische GC die geteilten Objekte anfasst und Seiten kopiert.
+    if not STATE.load('Preload'):
+        raise RuntimeError(
+            f'RAG_PRELOAD braucht einen fertigen Snapshot oder Embedding-Cache (python -m rag_service.build build): '
+            f'{STATE.stats()["last_error"]}'
+        )
+    gc.freeze()
+    logger.info('RAG-Service vorgeladen (%s Dokumente, %.1fs).', len(STATE.index), STATE.ready_at - STARTUP_STARTED)
+
+EXECUTOR = InferenceExecutor(RAG_INFERENCE_WORKERS, RAG_INFERENCE_QUEUE)
+
+# Prometheus-Metriken pro Worker-Prozess. Persona-Labels nur für Personas des Index (Kardinalität).
+METRICS = Registry()
+REQUEST_SECONDS = METRICS.histogram(
+    'rag_request_duration_seconds',
+    'Gesamtdauer einer RAG-Anfrage inklusive Warteschlange und Serialisierung.',
+    ('endpoint', 'persona'),
+)
+STAGE_SECONDS = METRICS.histogram(
+    'rag_stage_duration_seconds',
+    'Dauer einer Verarbeitungsstufe (encode, scoring, topk, serialization) pro Anfrage.',
+    ('stage', 'persona'),
+)
+EMPTY_RESULTS = METRICS.counter('rag_empty_results_total', 'Anfragen ohne Treffer.', ('persona',))
+ERRORS = METRICS.counter('rag_errors_total', 'Fehlgeschlagene Anfragen nach HTTP-Status.', ('endpoint', 'status'))
+EXACT_QUESTIONS = METRICS.counter(
+    'rag_exact_question_lookups_total',
+    'Lookups im Frage-Hash-Index nach Ergebnis (hit: Antwort ohne Encoder-Aufruf).',
+    ('result',),
 )
-logger.info('RAG-Service geladen (%s Dokumente).', len(INDEX))
 
-app = FastAPI(title='Ethik RAG Service', version='1.0.0')
 
+def exact_hit_ratio() -> float | None:
+    hits, misses = EXACT_QUESTIONS.value('hit'), EXACT_QUESTIONS.value('miss')
+    return hits / (hits + misses) if hits + misses else None
 
-def format_block(doc: Document) -> str:
-    return (
-        f'Quelle: {doc.source} (Persona: {doc.persona})\n'
-        f'Frage: {doc.question}\n'
-        f'Antwort: {doc.answer}'
-    )
+
+METRICS.gauge(
+    'rag_exact_question_hit_ratio',
+    'Anteil der Lookups mit wörtlichem Fragetreffer.',
+    exact_hit_ratio,
+)
+QUERY_ENDPOINTS = ('/v1/rag/query', '/v1/rag/query:batch')
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Der Index wird im Hintergrund gebaut, damit uvicorn sofort den Port bindet; Threads starten
+    # erst hier, weil sie einen fork() nicht überleben.
+    if not STATE.ready:
+        STATE.reload('Start')
+    else:
+        # Vorgeladener Index: jeder Worker lädt sein Modell nach dem fork() selbst, vor der ersten Anfrage.
+        _ = STATE.index.encoder
+    STATE.watch(RAG_RELOAD_INTERVAL_SECONDS)
+    yield
+    STATE.stop()
 
 
-class DocumentChunk(BaseModel):
-    persona: str
-    source: str
-    question: str
-    answer: str
-    score: float
-    block: str
+app = FastAPI(title='Ethik RAG Service', version='1.0.0', lifespan=lifespan)
 
 
-class QueryRequest(BaseModel):
-    query: str = Field(..., min_length=1)
-    persona: str | None = None
-    top_k: int | None = Field(default=None, ge=1, le=20)
+class ErrorMetricsMiddleware:
+    # Reine ASGI-Middleware: zählt 4xx/5xx der Query-Endpunkte, auch Validierungsfehler vor dem Handler.
+    def __init__(self, app: Any) -> None:
+        self.app = app
 
+    async def __call__(self, scope: dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        path = scope.get('path')
+        if scope['type'] != 'http' or path not in QUERY_ENDPOINTS:
+            await self.app(scope, receive, send)
+            return
 
-class QueryResponse(BaseModel):
-    persona: str | None
-    query: str
-    top_k: int
-    chunks: list[DocumentChunk]
-    total_documents: int
+        async def send_counted(message: dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start' and message['status'] >= 400:
+                ERRORS.inc(path, str(message['status']))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counted)
+        except Exception:
+            ERRORS.inc(path, '500')
+            raise
+
+
+app.add_middleware(ErrorMetricsMiddleware)
 
 
 @app.get('/healthz')
 def healthcheck() -> dict[str, Any]:
+    # Liveness: antwortet auch während des ersten Index-Builds.
+    index = STATE.index
+    ready_at = STATE.ready_at
     return {
         'status': 'ok',
-        'documents': len(INDEX),
+        'ready': index is not None,
+        'documents': len(index) if index is not None else None,
         'model': RAG_EMBED_MODEL,
+        'shard': SHARD.stats(),
+        'snapshot_dir': str(CACHE_DIR) if BAKED else None,
+        'pid': os.getpid(),
+        'startup_seconds': round(ready_at - STARTUP_STARTED, 3) if ready_at is not None else None,
+        'memory': memory_usage(),
+        'index': index.stats() if index is not None else None,
+        'executor': EXECUTOR.stats(),
+        'reload': STATE.stats(),
+    }
+
+
+@app.get('/readyz')
+def readiness() -> JSONResponse:
+    index = STATE.index
+    payload = {
+        'ready': index is not None,
+        'documents': len(index) if index is not None else None,
+        'shard': SHARD.stats(),
+        'progress': STATE.progress.stats(),
+        'last_error': STATE.stats()['last_error'],
     }
+    return JSONResponse(payload, status_code=200 if index is not None else 503)
+
+
+@app.get('/metrics')
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(METRICS.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.post('/admin/reload', status_code=202)
+def admin_reload(x_admin_token: str | None = Header(default=None)) -> dict[str, Any]:
+    if RAG_ADMIN_TOKEN and x_admin_token != RAG_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail='Ungültiges Admin-Token')
+    started = STATE.reload('Admin-Endpoint')
+    return {'started': started, 'reload': STATE.stats()}
+
+
+def require_index() -> VectorIndex:
+    index = STATE.index
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail='RAG-Index wird noch aufgebaut',
+            headers={'Retry-After': str(RAG_RETRY_AFTER_SECONDS)},
+        )
+    return index
+
+
+async def run_inference(fn: Callable[..., T], *args: object) -> T:
+    try:
+        return await EXECUTOR.run(fn, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail='RAG-Service ausgelastet, bitte später erneut versuchen',
+            headers={'Retry-After': str(RAG_RETRY_AFTER_SECONDS)},
+        ) from None
+
+
+def timed(fn: Callable[..., T], *args: object) -> tuple[T, dict[str, float]]:
+    # Läuft im Inferenz-Thread; die Stufen im Index addieren ihre Dauer auf timings.
+    with record() as timings:
+        return fn(*args), timings
+
+
+def persona_label(index: VectorIndex, persona: str | None) -> str:
+    if persona is None:
+        return 'all'
+    return persona if persona in index.personas else 'unknown'
+
+
+def observe(endpoint: str, label: str, started: float, timings: dict[str, float], serialization: float) -> None:
+    for name in STAGES:
+        if name in timings:
+            STAGE_SECONDS.observe(timings[name], name, label)
+    for result in ('hit', 'miss'):
+        if timings.get(f'exact_{result}'):
+            EXACT_QUESTIONS.inc(result, amount=timings[f'exact_{result}'])
+    STAGE_SECONDS.observe(serialization, 'serialization', label)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, label)
 
 
 @app.post('/v1/rag/query', response_model=QueryResponse)
-def rag_query(request: QueryRequest) -> QueryResponse:
+async def rag_query(request: QueryRequest, accept: str | None = Header(default=None)) -> Response:
+    started = time.perf_counter()
     if not request.query.strip():
         raise HTTPException(status_code=400, detail='query muss gesetzt sein')
     persona = request.persona.lower() if request.persona else None
     top_k = request.top_k or RAG_TOP_K_DEFAULT
-    results = INDEX.query(persona, request.query.strip(), top_k)
-    chunks = [
-        DocumentChunk(
-            persona=result.document.persona,
-            source=result.document.source,
-            question=result.document.question,
-            answer=result.document.answer,
-            score=result.score,
-            block=format_block(result.document),
-        )
-        for result in results
-    ]
-    return QueryResponse(
-        persona=persona,
-        query=request.query,
-        top_k=top_k,
-        chunks=chunks,
-        total_documents=len(INDEX),
+    index = require_index()
+    results, timings = await run_inference(
+        timed, index.query, persona, request.query.strip(), top_k, request.prefilter
+    )
+    label = persona_label(index, persona)
+    if not results:
+        EMPTY_RESULTS.inc(label)
+    serialize_started = time.perf_counter()
+    media_type = negotiate(accept)
+    if media_type == JSON:
+        body: str | bytes = build_response(request.query, persona, top_k, results, len(index)).model_dump_json()
+    else:
+        body = dumps(compact_response(request.query, persona, top_k, results, len(index)), media_type)
+    observe('/v1/rag/query', label, started, timings, time.perf_counter() - serialize_started)
+    return Response(body, media_type=media_type, headers={'Vary': 'Accept'})
+
+
+@app.post('/v1/rag/query:batch', response_model=BatchQueryResponse)
+async def rag_query_batch(request: BatchQueryRequest, accept: str | None = Header(default=None)) -> Response:
+    started = time.perf_counter()
+    items: list[tuple[str | None, str, int]] = []
+    for position, item in enumerate(request.items):
+        if not item.query.strip():
+            raise HTTPException(status_code=400, detail=f'items[{position}].query muss gesetzt sein')
+        persona = item.persona.lower() if item.persona else None
+        items.append((persona, item.query.strip(), item.top_k or RAG_TOP_K_DEFAULT))
+    index = require_index()
+    results, timings = await run_inference(
+        timed, index.query_batch, items, [item.prefilter for item in request.items]
     )
+    labels = [persona_label(index, persona) for persona, _, _ in items]
+    for label, item_results in zip(labels, results):
+        if not item_results:
+            EMPTY_RESULTS.inc(label)
+    serialize_started = time.perf_counter()
+    media_type = negotiate(accept)
+    if media_type == JSON:
+        body: str | bytes = BatchQueryResponse(
+            results=[
+                build_response(item.query, persona, top_k, item_results, len(index))
+                for item, (persona, _, top_k), item_results in zip(request.items, items, results)
+            ],
+        ).model_dump_json()
+    else:
+        compact = [
+            compact_response(item.query, persona, top_k, item_results, len(index))
+            for item, (persona, _, top_k), item_results in zip(request.items, items, results)
+        ]
+        body = dumps({'results': compact}, media_type)
+    # Stufenzeiten gelten für den ganzen Batch; gemischte Personas laufen unter 'mixed'.
+    label = labels[0] if len(set(labels)) == 1 else 'mixed'
+    observe('/v1/rag/query:batch', label, started, timings, time.perf_counter() - serialize_started)
+    return Response(body, media_type=media_type, headers={'Vary': 'Accept'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from typing import Sequence
+
+from .documents import Document
+from .store import DocumentStore
+
+SHARD_MODES = ('hash', 'persona')
+
+
+def _bucket(text: str, count: int) -> int:
+    # blake2b statt hash(): muss über Prozesse und Neustarts hinweg stabil sein (PYTHONHASHSEED).
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % count
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    # Partition dieses Prozesses: hash verteilt Dokumente gleichmäßig, persona hält eine Persona auf einem Shard.
+    index: int = 0
+    count: int = 1
+    mode: str = 'hash'
+
+    def __post_init__(self) -> None:
+        if self.mode not in SHARD_MODES:
+            raise ValueError(f'Unbekannter Shard-Modus: {self.mode}')
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f'Ungültiger Shard {self.index}/{self.count}')
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    @property
+    def name(self) -> str:
+        return f'{self.mode}-{self.index}-of-{self.count}'
+
+    def owner(self, doc: Document) -> int:
+        return _bucket(doc.persona if self.mode == 'persona' else doc.context, self.count)
+
+    def select(self, documents: Sequence[Document] | DocumentStore) -> DocumentStore:
+        store = documents if isinstance(documents, DocumentStore) else DocumentStore.from_documents(documents)
+        if not self.enabled:
+            return store
+        return store.take(idx for idx, doc in enumerate(store) if self.owner(doc) == self.index)
+
+    def stats(self) -> dict[str, object]:
+        return {'index': self.index, 'count': self.count, 'mode': self.mode}
+
+
+def persona_shard(persona: str, count: int) -> int:
+    # Im persona-Modus muss der Koordinator eine Persona-Anfrage nur an einen Shard schicken.
+    return _bucket(persona, count)
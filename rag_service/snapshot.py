@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+
+from .store import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+# Aufbau: Magic, Version, Header-Länge, Header-Digest, JSON-Header (inkl. Persona-, Quellen- und
+# System-Tabellen), dann 64-Byte-ausgerichtete Sektionen mit den Spalten des DocumentStore und den
+# Embeddings. Jede Sektion hat einen eigenen blake2b-Digest.
+MAGIC = b'RAGSNAP\x00'
+VERSION = 3
+_PREAMBLE = struct.Struct('<8sII16s')
+_ALIGN = 64
+_DIGEST_BYTES = 16
+_READ_BYTES = 8 << 20
+_ID_COLUMNS = ('persona_ids', 'source_ids', 'system_ids')
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    path: Path
+    signature: str
+    # Encoder, der die Embeddings tatsächlich erzeugt hat (Modell plus aktives Backend, nach Fallbacks).
+    model_id: str
+    documents: DocumentStore
+    persona_map: dict[str, tuple[int, int]]
+    dtype: str
+    shape: tuple[int, int]
+    embeddings_offset: int
+
+    def embeddings(self, mmap: bool) -> np.ndarray:
+        if mmap:
+            return np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.embeddings_offset, shape=self.shape)
+        count = self.shape[0] * self.shape[1]
+        with self.path.open('rb') as handle:
+            handle.seek(self.embeddings_offset)
+            return np.fromfile(handle, dtype=self.dtype, count=count).reshape(self.shape)
+
+
+def _digest(data: bytes | memoryview) -> str:
+    return hashlib.blake2b(data, digest_size=_DIGEST_BYTES).hexdigest()
+
+
+def _pad(handle: BinaryIO) -> None:
+    handle.write(b'\x00' * (-handle.tell() % _ALIGN))
+
+
+def write_snapshot(
+    path: Path,
+    key: dict[str, object],
+    signature: str,
+    model_id: str,
+    documents: DocumentStore,
+    persona_map: dict[str, tuple[int, int]],
+    embeddings: np.ndarray,
+) -> None:
+    matrix = np.ascontiguousarray(embeddings)
+    sections = {
+        'text': memoryview(documents.text),
+        'offsets': memoryview(np.ascontiguousarray(documents.offsets, dtype=np.int64).view(np.uint8)),
+        **{
+            name: memoryview(np.ascontiguousarray(getattr(documents, name), dtype=np.int32).view(np.uint8))
+            for name in _ID_COLUMNS
+        },
+        # Byte-View über die flache Matrix: memoryview.cast scheitert an leeren Matrizen (leerer Shard).
+        'embeddings': memoryview(matrix.reshape(-1).view(np.uint8)),
+    }
+    # Offsets der Sektionen relativ zum Ende des Headers; so muss der Header seine eigene Länge nicht kennen.
+    layout: dict[str, dict[str, object]] = {}
+    position = 0
+    for name, data in sections.items():
+        layout[name] = {'offset': position, 'length': data.nbytes, 'digest': _digest(data)}
+        position += data.nbytes + (-data.nbytes % _ALIGN)
+    header = json.dumps({
+        'key': key,
+        'signature': signature,
+        'model_id': model_id,
+        'documents': len(documents),
+        'tables': {'personas': documents.personas, 'sources': documents.sources, 'systems': documents.systems},
+        'persona_map': {persona: list(bounds) for persona, bounds in persona_map.items()},
+        'dtype': str(matrix.dtype),
+        'shape': list(matrix.shape),
+        'sections': layout,
+    }).encode('utf-8')
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with tmp_path.open('wb') as handle:
+        handle.write(_PREAMBLE.pack(MAGIC, VERSION, len(header), bytes.fromhex(_digest(header))))
+        handle.write(header)
+        _pad(handle)
+        for data in sections.values():
+            handle.write(data)
+            _pad(handle)
+    os.replace(tmp_path, path)
+
+
+def _verify(handle: BinaryIO, base: int, section: dict[str, object]) -> None:
+    # Embeddings blockweise prüfen, ohne sie komplett in den Speicher zu lesen.
+    handle.seek(base + int(section['offset']))
+    hasher = hashlib.blake2b(digest_size=_DIGEST_BYTES)
+    remaining = int(section['length'])
+    while remaining:
+        block = handle.read(min(remaining, _READ_BYTES))
+        if not block:
+            raise SnapshotError('Snapshot ist abgeschnitten')
+        hasher.update(block)
+        remaining -= len(block)
+    if hasher.hexdigest() != section['digest']:
+        raise SnapshotError('Prüfsumme einer Sektion stimmt nicht')
+
+
+def _read_section(handle: BinaryIO, base: int, section: dict[str, object]) -> bytes:
+    handle.seek(base + int(section['offset']))
+    data = handle.read(int(section['length']))
+    if len(data) != section['length']:
+        raise SnapshotError('Snapshot ist abgeschnitten')
+    if _digest(data) != section['digest']:
+        raise SnapshotError('Prüfsumme einer Sektion stimmt nicht')
+    return data
+
+
+def _read_header(handle: BinaryIO) -> tuple[dict[str, object] | None, int]:
+    # Header und Beginn der Sektionen; (None, 0) bei einer anderen Formatversion.
+    preamble = handle.read(_PREAMBLE.size)
+    if len(preamble) != _PREAMBLE.size:
+        raise SnapshotError('Snapshot ist abgeschnitten')
+    magic, version, header_length, header_digest = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise SnapshotError('Keine Snapshot-Datei')
+    if version != VERSION:
+        return None, 0
+    header_bytes = handle.read(header_length)
+    if len(header_bytes) != header_length or _digest(header_bytes) != header_digest.hex():
+        raise SnapshotError('Header-Prüfsumme stimmt nicht')
+    base = _PREAMBLE.size + header_length
+    return json.loads(header_bytes), base + -base % _ALIGN
+
+
+def _read(path: Path, key: dict[str, object]) -> Snapshot | None:
+    with path.open('rb') as handle:
+        header, base = _read_header(handle)
+        if header is None or header['key'] != key:
+            return None
+        sections = header['sections']
+        text = _read_section(handle, base, sections['text'])
+        offsets = np.frombuffer(_read_section(handle, base, sections['offsets']), dtype=np.int64)
+        columns = [np.frombuffer(_read_section(handle, base, sections[name]), dtype=np.int32) for name in _ID_COLUMNS]
+        embeddings = sections['embeddings']
+        _verify(handle, base, embeddings)
+    count = int(header['documents'])
+    dtype = str(header['dtype'])
+    shape = (int(header['shape'][0]), int(header['shape'][1]))
+    if offsets.shape[0] != 2 * count + 1 or shape[0] != count or offsets[-1] != len(text):
+        raise SnapshotError('Snapshot-Sektionen passen nicht zusammen')
+    if embeddings['length'] != shape[0] * shape[1] * np.dtype(dtype).itemsize:
+        raise SnapshotError('Snapshot-Sektionen passen nicht zusammen')
+    tables = header['tables']
+    # Kein Dekodieren pro Dokument: Puffer und Spalten werden direkt übernommen.
+    documents = DocumentStore(tables['personas'], tables['sources'], tables['systems'], *columns, text, offsets)
+    for column, table in zip(columns, (documents.personas, documents.sources, documents.systems)):
+        if column.size and (column.min() < 0 or column.max() >= len(table)):
+            raise SnapshotError('Snapshot-Spalten verweisen auf unbekannte Tabelleneinträge')
+    return Snapshot(
+        path=path,
+        signature=str(header['signature']),
+        model_id=str(header['model_id']),
+        documents=documents,
+        persona_map={persona: (int(start), int(stop)) for persona, (start, stop) in header['persona_map'].items()},
+        dtype=dtype,
+        shape=shape,
+        embeddings_offset=base + embeddings['offset'],
+    )
+
+
+def read_snapshot(path: Path, key: dict[str, object]) -> Snapshot | None:
+    # None heißt: kein, veralteter oder beschädigter Snapshot – der Aufrufer baut den Index normal auf.
+    if not path.exists():
+        return None
+    try:
+        snapshot = _read(path, key)
+    except (OSError, ValueError, KeyError, TypeError, UnicodeDecodeError) as exc:
+        logger.warning('RAG-Snapshot %s unbrauchbar (%s) – baue neu.', path, exc)
+        return None
+    if snapshot is None:
+        logger.info('RAG-Snapshot %s ist veraltet – baue neu.', path)
+    return snapshot
+
+
+def snapshot_matches(path: Path, key: dict[str, object], model_id: str) -> bool:
+    # Nur der Header: reicht, um einen bereits geschriebenen Snapshot nicht erneut zu schreiben.
+    try:
+        with path.open('rb') as handle:
+            header, _ = _read_header(handle)
+    except (OSError, ValueError):
+        return False
+    return header is not None and header.get('key') == key and header.get('model_id') == model_id
+
+
+def verify_snapshot(path: Path) -> dict[str, object]:
+    # Header plus Prüfsummen aller Sektionen, unabhängig vom Schlüssel – z. B. für `rag_service.build verify`.
+    with path.open('rb') as handle:
+        header, base = _read_header(handle)
+        if header is None:
+            raise SnapshotError(f'Snapshot-Formatversion wird nicht unterstützt (erwartet {VERSION})')
+        for section in header['sections'].values():
+            _verify(handle, base, section)
+    return header
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import Sequence
+
+import numpy as np
+
+from .documents import Document
+
+_TOKEN = re.compile(r'\w+')
+_MIN_TOKEN_LENGTH = 3
+# Terme, die in mehr als diesem Anteil der Dokumente vorkommen, grenzen nichts ein und werden ignoriert.
+_MAX_DOC_FREQUENCY = 0.1
+# Deckt der Vorfilter mehr als diesen Anteil des Kandidatenbereichs ab, ist der volle Scan billiger.
+_MAX_CANDIDATE_RATIO = 0.5
+_STOPWORDS = frozenset(
+    'aber alle als also auch auf aus bei bin bis das dass dem den der des die dies diese dieser du durch ein eine '
+    'einem einen einer eines er es für hat hatte ich ihr ihre ist kann mit nach nicht noch nur oder sein sich sie '
+    'sind so über um und uns von vor war was welche wenn wer wie wir wird wo zu zum zur'.split()
+)
+
+
+def tokenize(text: str) -> set[str]:
+    return {
+        token
+        for token in _TOKEN.findall(text.casefold())
+        if len(token) >= _MIN_TOKEN_LENGTH and token not in _STOPWORDS
+    }
+
+
+class KeywordIndex:
+    # Invertierter Index über Frage und Antwort: Term -> aufsteigend sortierte Dokument-Ids (CSR-Layout).
+    def __init__(self, vocabulary: dict[str, int], offsets: np.ndarray, postings: np.ndarray, size: int) -> None:
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._postings = postings
+        self._size = size
+        self._max_frequency = max(1, int(size * _MAX_DOC_FREQUENCY))
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._prefiltered = 0
+        self._fallbacks = 0
+        self._candidates = 0
+        self._scanned = 0
+
+    @classmethod
+    def build(cls, documents: Sequence[Document]) -> KeywordIndex:
+        lists: dict[str, list[int]] = {}
+        for idx, doc in enumerate(documents):
+            for token in tokenize(f'{doc.question} {doc.answer}'):
+                lists.setdefault(token, []).append(idx)
+        vocabulary: dict[str, int] = {}
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        for term_id, (token, ids) in enumerate(lists.items()):
+            vocabulary[token] = term_id
+            offsets[term_id + 1] = offsets[term_id] + len(ids)
+        postings = np.empty(int(offsets[-1]), dtype=np.int32)
+        for token, ids in lists.items():
+            term_id = vocabulary[token]
+            postings[offsets[term_id]:offsets[term_id + 1]] = ids
+        return cls(vocabulary, offsets, postings, len(documents))
+
+    def candidates(self, text: str, start: int, stop: int, min_hits: int) -> np.ndarray | None:
+        # Vereinigung der Posting-Listen im Bereich [start, stop); None heißt: voller Scan.
+        parts: list[np.ndarray] = []
+        for token in tokenize(text):
+            term_id = self._vocabulary.get(token)
+            if term_id is None:
+                continue
+            ids = self._postings[self._offsets[term_id]:self._offsets[term_id + 1]]
+            if ids.size > self._max_frequency:
+                continue
+            lo, hi = np.searchsorted(ids, (start, stop))
+            if hi > lo:
+                parts.append(ids[lo:hi])
+        found = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+        usable = min_hits <= found.size <= (stop - start) * _MAX_CANDIDATE_RATIO
+        with self._lock:
+            self._lookups += 1
+            if usable:
+                self._prefiltered += 1
+                self._candidates += found.size
+                self._scanned += stop - start
+            else:
+                self._fallbacks += 1
+        return found.astype(np.int64) if usable else None
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                'terms': len(self._vocabulary),
+                'postings': int(self._postings.size),
+                'bytes': int(self._postings.nbytes + self._offsets.nbytes),
+                'lookups': self._lookups,
+                'prefiltered': self._prefiltered,
+                'fallbacks': self._fallbacks,
+                'candidate_ratio': round(self._candidates / self._scanned, 4) if self._scanned else None,
+            }
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence, overload
+
+import numpy as np
+
+from .documents import Document, build_context, iter_documents
+
+# Blockgröße beim Iterieren: Offsets werden blockweise in Python-Ints umgewandelt statt für den ganzen Korpus.
+_ITER_BLOCK = 16384
+
+
+class DocumentStore(Sequence[Document]):
+    # Spaltenformat statt einer Liste von Dataclasses: Persona, Quelle und System-Prompt als Ids in
+    # internierte Tabellen, Frage und Antwort in einem UTF-8-Puffer mit Byte-Offsets
+    # (Frage i = text[offsets[2i]:offsets[2i + 1]], Antwort i = text[offsets[2i + 1]:offsets[2i + 2]]).
+    # Document-Objekte und Kontexte entstehen erst beim Zugriff.
+    def __init__(
+        self,
+        personas: Sequence[str],
+        sources: Sequence[str],
+        systems: Sequence[str],
+        persona_ids: np.ndarray,
+        source_ids: np.ndarray,
+        system_ids: np.ndarray,
+        text: bytes | bytearray,
+        offsets: np.ndarray,
+    ) -> None:
+        if not persona_ids.shape[0] == source_ids.shape[0] == system_ids.shape[0] == (offsets.shape[0] - 1) // 2:
+            raise ValueError('Spalten des Dokumentspeichers sind unterschiedlich lang')
+        self.personas = [sys.intern(persona) for persona in personas]
+        self.sources = [sys.intern(source) for source in sources]
+        self.systems = list(systems)
+        self.persona_ids = persona_ids
+        self.source_ids = source_ids
+        self.system_ids = system_ids
+        self.text = text
+        self.offsets = offsets
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document]) -> DocumentStore:
+        # Ein Durchlauf, ohne Zwischenliste: funktioniert auch direkt auf dem Generator des Loaders.
+        tables: tuple[dict[str, int], dict[str, int], dict[str, int]] = ({}, {}, {})
+        ids = (array('i'), array('i'), array('i'))
+        text = bytearray()
+        offsets = array('q', [0])
+        for doc in documents:
+            for table, column, value in zip(tables, ids, (doc.persona, doc.source, doc.system)):
+                key = table.get(value)
+                if key is None:
+                    key = table[value] = len(table)
+                column.append(key)
+            text += doc.question.encode('utf-8')
+            offsets.append(len(text))
+            text += doc.answer.encode('utf-8')
+            offsets.append(len(text))
+        return cls(
+            *(list(table) for table in tables),
+            *(np.frombuffer(column, dtype=np.int32) if column else np.empty(0, dtype=np.int32) for column in ids),
+            text,
+            np.frombuffer(offsets, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return int(self.persona_ids.shape[0])
+
+    @overload
+    def __getitem__(self, idx: int) -> Document: ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> DocumentStore: ...
+
+    def __getitem__(self, idx: int | slice) -> Document | DocumentStore:
+        if isinstance(idx, slice):
+            return self.take(range(*idx.indices(len(self))))
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, middle, stop = self.offsets[2 * idx:2 * idx + 3].tolist()
+        return self._document(idx, start, middle, stop)
+
+    def _document(self, idx: int, start: int, middle: int, stop: int) -> Document:
+        return Document(
+            self.personas[self.persona_ids.item(idx)],
+            self.text[start:middle].decode('utf-8'),
+            self.text[middle:stop].decode('utf-8'),
+            self.systems[self.system_ids.item(idx)],
+            self.sources[self.source_ids.item(idx)],
+        )
+
+    def __iter__(self) -> Iterator[Document]:
+        for block in range(0, len(self), _ITER_BLOCK):
+            stop = min(len(self), block + _ITER_BLOCK)
+            bounds = self.offsets[2 * block:2 * stop + 1].tolist()
+            for idx in range(block, stop):
+                position = 2 * (idx - block)
+                yield self._document(idx, bounds[position], bounds[position + 1], bounds[position + 2])
+
+    def persona(self, idx: int) -> str:
+        return self.personas[self.persona_ids.item(idx)]
+
+    def question(self, idx: int) -> str:
+        return self.text[self.offsets.item(2 * idx):self.offsets.item(2 * idx + 1)].decode('utf-8')
+
+    def questions(self) -> Iterator[str]:
+        # Nur die Fragen, ohne Document-Objekte (z. B. für den Frage-Hash-Index).
+        for block in range(0, len(self), _ITER_BLOCK):
+            bounds = self.offsets[2 * block:2 * min(len(self), block + _ITER_BLOCK)].tolist()
+            for position in range(0, len(bounds), 2):
+                yield self.text[bounds[position]:bounds[position + 1]].decode('utf-8')
+
+    def sizes(self, rows: np.ndarray) -> np.ndarray:
+        # Kontextlänge in Bytes (System-Prompt, Frage, Antwort), z. B. um Encoder-Batches nach Länge zu bilden.
+        system_sizes = np.array([len(system.encode('utf-8')) for system in self.systems], dtype=np.int64)
+        return self.offsets[2 * rows + 2] - self.offsets[2 * rows] + system_sizes[self.system_ids[rows]]
+
+    def contexts(self, rows: Iterable[int]) -> list[str]:
+        contexts = []
+        for idx in rows:
+            start, middle, stop = self.offsets[2 * idx:2 * idx + 3].tolist()
+            question = self.text[start:middle].decode('utf-8')
+            answer = self.text[middle:stop].decode('utf-8')
+            contexts.append(build_context(self.systems[self.system_ids.item(idx)], question, answer))
+        return contexts
+
+    def take(self, rows: Iterable[int]) -> DocumentStore:
+        # Neue Reihenfolge bzw. Teilmenge; die Tabellen werden geteilt, nur Ids und Textpuffer kopiert.
+        rows = np.fromiter(rows, dtype=np.int64)
+        starts = self.offsets[2 * rows]
+        stops = self.offsets[2 * rows + 2]
+        view = memoryview(self.text)
+        text = bytearray(int((stops - starts).sum()))
+        position = 0
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            text[position:position + stop - start] = view[start:stop]
+            position += stop - start
+        lengths = np.stack([self.offsets[2 * rows + 1] - starts, stops - self.offsets[2 * rows + 1]], axis=1)
+        offsets = np.zeros(2 * rows.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths.reshape(-1), out=offsets[1:])
+        return DocumentStore(
+            self.personas,
+            self.sources,
+            self.systems,
+            self.persona_ids[rows],
+            self.source_ids[rows],
+            self.system_ids[rows],
+            text,
+            offsets,
+        )
+
+    def sorted_by_persona(self) -> DocumentStore:
+        # Stabil nach Persona-Name sortiert, wie sorted(documents, key=persona); meist schon der Fall.
+        rank = np.argsort(np.argsort(np.array(self.personas, dtype=object), kind='stable'))
+        keys = rank[self.persona_ids]
+        if np.all(keys[:-1] <= keys[1:]):
+            return self
+        return self.take(np.argsort(keys, kind='stable'))
+
+    def persona_ranges(self) -> dict[str, tuple[int, int]]:
+        # Setzt eine nach Persona sortierte Ablage voraus (siehe sorted_by_persona).
+        if not len(self):
+            return {}
+        changes = np.flatnonzero(self.persona_ids[1:] != self.persona_ids[:-1]) + 1
+        starts = [0, *changes.tolist()]
+        stops = [*changes.tolist(), len(self)]
+        return {self.personas[self.persona_ids[start]]: (start, stop) for start, stop in zip(starts, stops)}
+
+    @property
+    def nbytes(self) -> int:
+        tables = sum(sys.getsizeof(value) for value in (*self.personas, *self.sources, *self.systems))
+        columns = self.persona_ids.nbytes + self.source_ids.nbytes + self.system_ids.nbytes + self.offsets.nbytes
+        return len(self.text) + columns + tables
+
+    def stats(self) -> dict[str, object]:
+        return {
+            'layout': 'columnar',
+            'bytes': self.nbytes,
+            'text_bytes': len(self.text),
+            'personas': len(self.personas),
+            'sources': len(self.sources),
+            'systems': len(self.systems),
+        }
+
+
+def load_document_store(
+    glob_pattern: str,
+    limit: int,
+    workers: int = 0,
+    chunk_bytes: int = 4 << 20,
+) -> tuple[DocumentStore, list[Path]]:
+    # Wie load_documents_parallel, aber die Dokumente werden direkt in Spalten übernommen.
+    used_files: list[Path] = []
+    store = DocumentStore.from_documents(iter_documents(glob_pattern, limit, workers, chunk_bytes, used_files))
+    return store, used_files
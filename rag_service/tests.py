@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import multiprocessing
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from .bench import write_synthetic_corpus
+from .documents import iter_documents, load_documents
+from .encoders import HashEncoder
+from .index import VectorIndex
+from .progress import BuildProgress
+from .reloader import IndexReloader
+from .snapshot import VERSION, read_snapshot
+from .store import DocumentStore, load_document_store
+
+# Klein genug für Sekunden pro Test, groß genug für mehrere Loader-Blöcke und Encoder-Chunks.
+_LINES = 1200
+_KEY = {'corpus': 'test', 'model': 'hash', 'dtype': 'float32'}
+
+
+def _build(documents: DocumentStore, cache_dir: Path, **kwargs: object) -> VectorIndex:
+    return VectorIndex(documents, cache_dir, 'sig', 'hash', 4, encoder=HashEncoder(), **kwargs)
+
+
+def _build_source(pattern: str, cache_dir: str) -> str:
+    # Läuft in einem eigenen Prozess (spawn), muss daher auf Modulebene liegen.
+    documents, _ = load_document_store(pattern, 0)
+    return _build(documents, Path(cache_dir), index_type='ivf').source
+
+
+class _CorpusTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        corpus = self.root / 'corpus'
+        corpus.mkdir()
+        write_synthetic_corpus(corpus, _LINES)
+        self.pattern = str(corpus / '*.jsonl')
+
+    def embeddings(self, index: VectorIndex, name: str) -> np.ndarray:
+        path = self.root / f'{name}.bin'
+        index.save_snapshot(path, _KEY)
+        return read_snapshot(path, _KEY).embeddings(False)
+
+
+class LoaderTests(_CorpusTestCase):
+    def test_parallel_loader_matches_sequential(self) -> None:
+        expected, _ = load_documents(self.pattern, 0)
+        parallel = list(iter_documents(self.pattern, 0, workers=2, chunk_bytes=4096))
+        self.assertEqual(parallel, expected)
+
+    def test_parallel_loader_respects_limit(self) -> None:
+        expected, _ = load_documents(self.pattern, 500)
+        parallel = list(iter_documents(self.pattern, 500, workers=2, chunk_bytes=4096))
+        self.assertEqual(parallel, expected)
+
+
+class BuildTests(_CorpusTestCase):
+    def test_parallel_build_matches_serial_build(self) -> None:
+        documents, _ = load_document_store(self.pattern, 0)
+        serial = _build(documents, self.root / 'serial')
+        parallel = _build(documents, self.root / 'parallel', build_workers=2)
+        self.assertEqual(serial.source, 'build')
+        self.assertEqual(parallel.source, 'build')
+        np.testing.assert_array_equal(self.embeddings(parallel, 'parallel'), self.embeddings(serial, 'serial'))
+
+    def test_concurrent_builds_share_one_build(self) -> None:
+        cache_dir = self.root / 'cache'
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(4) as pool:
+            sources = pool.starmap(_build_source, [(self.pattern, str(cache_dir))] * 4)
+        self.assertEqual(sorted(sources), ['build', 'cache', 'cache', 'cache'])
+
+
+class SnapshotTests(_CorpusTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        documents, _ = load_document_store(self.pattern, 0)
+        self.documents = documents.sorted_by_persona()
+        self.index = _build(documents, self.root / 'cache')
+        self.path = self.root / 'snapshot.bin'
+        self.index.save_snapshot(self.path, _KEY)
+
+    def test_roundtrip(self) -> None:
+        snapshot = read_snapshot(self.path, _KEY)
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(list(snapshot.documents), list(self.documents))
+        self.assertEqual(snapshot.model_id, self.index.model_id)
+
+    def test_stale_key_is_ignored(self) -> None:
+        self.assertIsNone(read_snapshot(self.path, {**_KEY, 'corpus': 'changed'}))
+
+    def test_corrupt_section_is_ignored(self) -> None:
+        data = bytearray(self.path.read_bytes())
+        data[-100] ^= 0xFF
+        self.path.write_bytes(bytes(data))
+        self.assertIsNone(read_snapshot(self.path, _KEY))
+
+    def test_truncated_file_is_ignored(self) -> None:
+        data = self.path.read_bytes()
+        self.path.write_bytes(data[:len(data) // 2])
+        self.assertIsNone(read_snapshot(self.path, _KEY))
+
+    def test_other_version_is_ignored(self) -> None:
+        data = bytearray(self.path.read_bytes())
+        data[8:12] = (VERSION + 1).to_bytes(4, 'little')
+        self.path.write_bytes(bytes(data))
+        self.assertIsNone(read_snapshot(self.path, _KEY))
+
+    def test_missing_file_is_ignored(self) -> None:
+        self.assertIsNone(read_snapshot(self.root / 'missing.bin', _KEY))
+
+
+class ReloaderTests(unittest.TestCase):
+    def test_failed_reload_waits_for_corpus_change(self) -> None:
+        state = ['v1']
+        attempts = []
+
+        def build(previous: VectorIndex | None, progress: BuildProgress) -> VectorIndex:
+            attempts.append(state[0])
+            raise RuntimeError('kaputt')
+
+        reloader = IndexReloader(None, build, lambda: state[0])
+        self.addCleanup(reloader.stop)
+        reloader.load('Start')
+        reloader.watch(0.01)
+        time.sleep(0.2)
+        self.assertEqual(attempts, ['v1'])
+        state[0] = 'v2'
+        time.sleep(0.2)
+        self.assertEqual(attempts, ['v1', 'v2'])
+        self.assertFalse(reloader.ready)
+
+
+if __name__ == '__main__':
+    unittest.main()